@@ -1,44 +1,127 @@
+import os
+from functools import lru_cache
 import dash
 from dash import dcc, html
 from dash.dependencies import Input, Output
-import plotly.express as px
-import pandas as pd
+from loader import data_version
+from shared_data import load_shared
+from row_index import date_extent
+from cube import stream_cube
+from time_pyramid import build_pyramid, time_series
+from render import payload_report, render_figure, zoom_range
+from warmup import popular_views, record_request, serve_warmup, start_warmup
+from serve_dash import cached_result, shared_cache
+from instrument import finish_run, serve_metrics, stage, start_run
 
-# Load the dataset
-df = pd.read_csv('cars_2024.csv')
+# Number of state/type figures kept in memory
+FIGURE_CACHE_SIZE = 128
+
+# Time the startup stages like the callbacks
+start_run('001.py')
+
+# Daily counts per state/type/maker/fuel, streamed from the CSV in chunks so
+# the raw rows are never all in memory, and shared by every worker process
+with stage('load_data') as record:
+    version = data_version('cars_2024.csv')
+    cube = load_shared('registrations-2024-cube', (os.path.abspath('cars_2024.csv'), version),
+                       lambda: stream_cube('cars_2024.csv'))
+    record['rows_out'] = len(cube)
+
+# Day/week/month/year counts per state/type segment and maker, so a figure
+# reads the grain its window calls for instead of regrouping the daily cells
+pyramid = build_pyramid(cube)
+
+# Dropdown options, computed once at startup
+states = cube['state'].dropna().unique()
+types = cube['type'].dropna().unique()
+state_options = [{'label': state, 'value': state} for state in states]
+type_options = [{'label': vtype, 'value': vtype} for vtype in types]
 
 # Initialize the Dash app
 app = dash.Dash(__name__)
 
+# Stage totals for Prometheus at /metrics, warm-up progress at /warmup
+serve_metrics(app.server)
+serve_warmup(app.server)
+
+# Figures computed by any worker process, shared through flask-caching (see serve_dash.py)
+cache = shared_cache(app.server)
+
 # Layout of the dashboard
 app.layout = html.Div([
     html.H1("Vehicle Sales Dashboard"),
     html.Label("Select State:"),
     dcc.Dropdown(
         id='state-dropdown',
-        options=[{'label': state, 'value': state} for state in df['state'].unique()],
-        value=df['state'].unique()[0]
+        options=state_options,
+        value=states[0]
     ),
     html.Label("Select Vehicle Type:"),
     dcc.Dropdown(
         id='type-dropdown',
-        options=[{'label': vtype, 'value': vtype} for vtype in df['type'].unique()],
-        value=df['type'].unique()[0]
+        options=type_options,
+        value=types[0]
     ),
-    dcc.Graph(id='sales-graph')
+    dcc.Graph(id='sales-graph'),
+    html.Div(id='sales-payload')
 ])
 
-# Callback to update the graph based on dropdown selections
+# Callback to update the graph based on dropdown selections, and to redraw
+# the zoomed window at full resolution when the graph is zoomed
 @app.callback(
-    Output('sales-graph', 'figure'),
+    [Output('sales-graph', 'figure'),
+     Output('sales-payload', 'children')],
     [Input('state-dropdown', 'value'),
-     Input('type-dropdown', 'value')]
+     Input('type-dropdown', 'value'),
+     Input('sales-graph', 'relayoutData')]
 )
-def update_graph(selected_state, selected_type):
-    filtered_df = df[(df['state'] == selected_state) & (df['type'] == selected_type)]
-    fig = px.bar(filtered_df, x='date_reg', y='model', color='maker', barmode='group')
-    return fig
+def update_graph(selected_state, selected_type, relayout_data=None):
+    start_run('001.py')
+    with stage('callback'):
+        # A zoom left over from the previous selection does not carry over
+        window = zoom_range(relayout_data) if relayout_data and dash.ctx.triggered_id == 'sales-graph' else None
+        if window is None:
+            record_request('001.py', (selected_state, selected_type))
+        figure, payload = build_figure(selected_state, selected_type, window)
+    finish_run()
+    return figure, payload
+
+# Figure for one state/type combination and zoom window, memoized so revisiting
+# it is instant, and drawn once for every worker sharing the cache
+@lru_cache(maxsize=FIGURE_CACHE_SIZE)
+def build_figure(selected_state, selected_type, window=None):
+    with stage('shared_cache'):
+        return cached_result(cache, ('001.figure', selected_state, selected_type, window, version),
+                             lambda: draw_figure(selected_state, selected_type, window))
+
+# Figure and payload report for one state/type combination and zoom window
+def draw_figure(selected_state, selected_type, window=None):
+    # Count registrations per period and maker instead of plotting one bar per row,
+    # per day, week, month or year depending on the width of the window
+    with stage('aggregate', rows_in=len(cube)) as record:
+        start_date, end_date = window if window is not None else date_extent(cube)
+        grouped_df = time_series(pyramid, start_date, end_date, segment=(selected_state, selected_type), split=True).reset_index()
+        record['rows_out'] = len(grouped_df)
+
+    # Downsample above DASHBOARD_MAX_POINTS; the points of a zoomed window get the whole budget.
+    # plotly.express loads with the first figure instead of delaying the server's start.
+    with stage('figure', rows_in=len(grouped_df)) as record:
+        import plotly.express as px
+        fig = render_figure(px.bar(grouped_df, x='date_reg', y='count', color='maker', barmode='group'))
+        fig.update_layout(uirevision=f"{selected_state}/{selected_type}")
+        if window is not None:
+            fig.update_xaxes(range=list(window))
+        record['rows_out'] = fig.layout.meta['points_shown']
+        return fig.to_dict(), payload_report(fig)
+
+# Build the figure of every state/type combination in the background from
+# server start, the most requested first, so first visits are cache hits too
+warmup_pairs = [(state, vtype) for state in states for vtype in types]
+popular_pairs = [pair for pair in popular_views('001.py', len(warmup_pairs)) if pair in warmup_pairs]
+start_warmup('001.py', version,
+             [(f"{state}/{vtype}", (state, vtype), lambda state=state, vtype=vtype: build_figure(state, vtype, None))
+              for state, vtype in popular_pairs + [pair for pair in warmup_pairs if pair not in popular_pairs]])
 
-# Run the app
+# Run the app in debug mode; serve_dash.py runs it with gunicorn workers
 if __name__ == '__main__':
     app.run_server(debug=True)
@@ -1,9 +1,33 @@
 import streamlit as st
-import pandas as pd
 import plotly.express as px
+from loader import data_version, format_footprint
+from row_index import date_extent
+from cube import stream_cube
+from time_pyramid import LEVEL_NAMES, build_pyramid, pick_resolution, time_series
+from figure_cache import cached_figure
+from render import payload_report, render_figure
+from instrument import debug_panel, finish_run, stage, start_run
+
+# Daily counts per state/type/maker/fuel, streamed from the CSV in chunks
+# so the raw rows are never all in memory
+@st.cache_data
+def load_cube():
+    return stream_cube('cars_2024.csv')
+
+# Day/week/month/year counts per state/type segment and maker, so the chart
+# reads the grain it draws instead of regrouping the daily cells
+@st.cache_resource
+def load_pyramid():
+    return build_pyramid(load_cube())
+
+# Time every stage of this rerun
+start_run('002.py')
 
 # Load the dataset
-df = pd.read_csv('cars_2024.csv')
+with stage('load_data') as record:
+    cube = load_cube()
+    pyramid = load_pyramid()
+    record['rows_out'] = len(cube)
 
 # Streamlit application layout
 st.title("Vehicle Sales Dashboard")
@@ -14,23 +38,45 @@ st.sidebar.header("Filter Options")
 # Dropdown for selecting state in the sidebar
 selected_state = st.sidebar.selectbox(
     "Select State:",
-    options=df['state'].unique()
+    options=cube['state'].unique()
 )
 
 # Dropdown for selecting vehicle type in the sidebar
 selected_type = st.sidebar.selectbox(
     "Select Vehicle Type:",
-    options=df['type'].unique()
+    options=cube['type'].unique()
 )
 
-# Filter the dataframe based on selections
-filtered_df = df[(df['state'] == selected_state) & (df['type'] == selected_type)]
+# Draw every point instead of downsampling large charts
+full_resolution = st.sidebar.toggle("Full resolution charts", value=False)
+
+# Report how much memory the cached cube takes
+st.sidebar.caption(format_footprint(cube))
 
-# Group the data by date_reg and maker, and count the number of vehicles
-grouped_df = filtered_df.groupby(['date_reg', 'maker']).size().reset_index(name='count')
+# Daily counts for full resolution charts, otherwise the coarsest grain keeping the date range readable
+resolution = 'D' if full_resolution else pick_resolution(*date_extent(cube))
 
-# Plot the filtered data as a line chart
-fig = px.line(grouped_df, x='date_reg', y='count', color='maker', title=f"Vehicle Sales in {selected_state} for {selected_type} Type")
+# Read the selected segment's counts per period and maker from the pyramid, and plot them as a line chart
+def sales_figure():
+    with stage('aggregate', rows_in=len(cube)) as record:
+        grouped_df = time_series(pyramid, segment=(selected_state, selected_type), freq=resolution, split=True).reset_index()
+        record['rows_out'] = len(grouped_df)
 
-# Display the plot
+    # Downsample above DASHBOARD_MAX_POINTS and draw with WebGL
+    with stage('figure', rows_in=len(grouped_df)):
+        fig = px.line(grouped_df, x='date_reg', y='count', color='maker', labels={'date_reg': LEVEL_NAMES[resolution]},
+                      title=f"Vehicle Sales in {selected_state} for {selected_type} Type")
+        return render_figure(fig, full_resolution=full_resolution)
+
+# Reuse the figure of an earlier rerun with the same selections until the export changes
+with stage('figure_cache'):
+    fig = cached_figure('002.sales', (selected_state, selected_type, full_resolution), data_version('cars_2024.csv'), sales_figure)
+
+# Display the plot and the size of what it sent to the browser
 st.plotly_chart(fig)
+st.caption(payload_report(fig))
+
+# Publish this rerun's stage timings
+finish_run()
+debug_panel()
+
@@ -1,18 +1,47 @@
 import streamlit as st
-import pandas as pd
 import plotly.express as px
-
-# Load the dataset
-df = pd.read_parquet('cars.parquet')
-
-# Convert 'date_reg' to datetime format if not already done
-df['date_reg'] = pd.to_datetime(df['date_reg'], errors='coerce')
-
-# Create a 'year' column
-df['year'] = df['date_reg'].dt.year
-
-# Group the data by year and maker, then count the number of vehicles in each group
-grouped_yearly_df = df.groupby(['year', 'maker']).size().reset_index(name='count')
+from loader import data_version, format_footprint, parquet_source
+from ingest import load_monthly_cube
+from query_backend import get_backend
+from topk import TOP_K, build_topk_index, top_makers
+from time_pyramid import build_pyramid, time_series
+from figure_cache import cached_figure
+from render import payload_report, render_figure
+from instrument import debug_panel, finish_run, stage, start_run
+
+# Build the monthly registration count cube once and keep it cached,
+# reusing the one ingest.py keeps next to the partitioned dataset
+# and otherwise building it with DuckDB when installed (see DASHBOARD_BACKEND)
+@st.cache_data
+def load_cube(source, version):
+    cube = load_monthly_cube(source)
+    if cube is None:
+        cube = get_backend().cube(source, freq='M')
+    return cube
+
+# Monthly and yearly counts per state/type segment and maker, so the charts
+# read the grain they draw instead of regrouping the cube
+@st.cache_resource
+def load_pyramid(source, version):
+    return build_pyramid(load_cube(source, version))
+
+# Maker counts per month/state/type as prefix sums, so the top makers of any
+# selection are a subtraction plus the days of the partial months at its ends
+@st.cache_resource
+def load_topk_index(source, version):
+    return build_topk_index(load_cube(source, version))
+
+# Time every stage of this rerun
+start_run('003.py')
+
+# Load the cube, reloading whenever ingest.py adds a batch
+with stage('load_data') as record:
+    source = parquet_source()
+    version = data_version(source)
+    cube = load_cube(source, version)
+    pyramid = load_pyramid(source, version)
+    topk_index = load_topk_index(source, version)
+    record['rows_out'] = len(cube)
 
 # Streamlit application layout
 st.title("Vehicle Sales Dashboard")
@@ -21,47 +50,71 @@ st.title("Vehicle Sales Dashboard")
 st.sidebar.header("Filter Options")
 
 # Dropdown for selecting year in the sidebar
-years = df['year'].unique()
+years = cube['year'].dropna().unique()
 selected_year = st.sidebar.selectbox("Select Year:", options=years)
 
 # Dropdown for selecting state in the sidebar
-states = df['state'].unique()
+states = cube['state'].unique()
 selected_state = st.sidebar.selectbox("Select State:", options=states)
 
 # Dropdown for selecting vehicle type in the sidebar
-types = df['type'].unique()
+types = cube['type'].unique()
 selected_type = st.sidebar.selectbox("Select Vehicle Type:", options=types)
 
-# Filter the dataframe based on selections
-filtered_df = df[(df['state'] == selected_state) & (df['type'] == selected_type)]
-
-# Group the filtered data by year, maker, and count the number of vehicles
-filtered_df_grouped = filtered_df.groupby(['year', 'maker']).size().reset_index(name='count')
-
-# Plot the yearly data
-fig_yearly = px.line(filtered_df_grouped, x='year', y='count', color='maker',
-                     title="Yearly Vehicle Sales by Maker")
-
-# Display the yearly plot
+# Draw every point instead of downsampling large charts
+full_resolution = st.sidebar.toggle("Full resolution charts", value=False)
+
+# Report how much memory the cached cube takes
+st.sidebar.caption(format_footprint(cube))
+
+# Read the selected segment's yearly counts per maker from the pyramid, and plot them
+def yearly_figure():
+    with stage('aggregate', rows_in=len(cube)) as record:
+        filtered_df_grouped = time_series(pyramid, segment=(selected_state, selected_type), freq='Y', split=True).reset_index()
+        filtered_df_grouped.insert(0, 'year', filtered_df_grouped.pop('date_reg').dt.year)
+        record['rows_out'] = len(filtered_df_grouped)
+
+    with stage('figure', rows_in=len(filtered_df_grouped)):
+        fig = px.line(filtered_df_grouped, x='year', y='count', color='maker',
+                      title="Yearly Vehicle Sales by Maker")
+        return render_figure(fig, full_resolution=full_resolution)
+
+# Read the selected year's monthly counts per maker from the pyramid, and plot the top makers
+def top_makers_figure():
+    with stage('aggregate', rows_in=len(cube)) as record:
+        grouped_df = time_series(pyramid, f"{int(selected_year)}-01-01", f"{int(selected_year)}-12-31",
+                                 segment=(selected_state, selected_type), freq='M', split=True).reset_index()
+        grouped_df.insert(0, 'year_month', grouped_df.pop('date_reg').dt.strftime('%Y-%m'))
+
+        # Get the top makers from the precomputed index
+        selected_makers = top_makers(topk_index, TOP_K, state=selected_state, vehicle_type=selected_type,
+                                     year=int(selected_year)).index
+        top_5_df = grouped_df[grouped_df['maker'].isin(selected_makers)]
+        record['rows_out'] = len(top_5_df)
+
+    with stage('figure', rows_in=len(top_5_df)):
+        fig = px.line(top_5_df, x='year_month', y='count', color='maker',
+                      title=f"Top {TOP_K} Vehicle Makers in {selected_state} for {selected_type} Type in {selected_year}")
+        return render_figure(fig, full_resolution=full_resolution)
+
+# Display the yearly plot, reusing the figure of an earlier rerun with the same
+# selections until ingest.py adds a batch
+with stage('figure_cache'):
+    fig_yearly = cached_figure('003.yearly_makers', (selected_state, selected_type, full_resolution), (source, version), yearly_figure)
 st.plotly_chart(fig_yearly)
+st.caption(payload_report(fig_yearly))
 
 if selected_year:
-    # Filter the dataframe based on the selected year
-    yearly_filtered_df = filtered_df[filtered_df['year'] == selected_year]
-
-    # Group the data by year_month and maker, and count the number of vehicles
-    yearly_filtered_df['year_month'] = yearly_filtered_df['date_reg'].dt.to_period('M').astype(str)
-    grouped_df = yearly_filtered_df.groupby(['year_month', 'maker']).size().reset_index(name='count')
-
-    # Get the top 5 makers
-    top_makers = grouped_df.groupby('maker')['count'].sum().nlargest(5).index
-    top_5_df = grouped_df[grouped_df['maker'].isin(top_makers)]
-
-    # Plot the top 5 makers data as a line chart
-    fig_top_5 = px.line(top_5_df, x='year_month', y='count', color='maker',
-                        title=f"Top 5 Vehicle Makers in {selected_state} for {selected_type} Type in {selected_year}")
-
-    # Display the top 5 plot
+    # Display the top makers plot of the selected year
+    with stage('figure_cache'):
+        fig_top_5 = cached_figure('003.top_makers', (selected_state, selected_type, int(selected_year), full_resolution),
+                                  (source, version), top_makers_figure)
     st.plotly_chart(fig_top_5)
+    st.caption(payload_report(fig_top_5))
 else:
     st.write("Please select a year to display the top 5 chart.")
+
+# Publish this rerun's stage timings
+finish_run()
+debug_panel()
+
@@ -1,22 +1,57 @@
 import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
+from loader import format_footprint, load_registrations, stream_only
+from paged_table import paged_table
+from stats_engine import build_cube_summaries, describe_selection
+from row_index import date_extent, date_slice
+from cube import slice_cube, stream_cube
+from time_pyramid import LEVEL_NAMES, build_pyramid, pick_resolution, range_counts, time_series
+from instrument import debug_panel, finish_run, stage, start_run
 
-# Load the data
-data = pd.read_csv('cars_2024.csv')
+# Function to load csv data
+@st.cache_data
+def load_data():
+    return load_registrations('cars_2024.csv')
 
-# Convert the date_reg column to datetime
-data['date_reg'] = pd.to_datetime(data['date_reg'])
+# Daily counts per state/type/maker/fuel, streamed from the CSV in chunks
+# so the charts never need the raw rows in memory
+@st.cache_data
+def load_cube():
+    return stream_cube('cars_2024.csv')
+
+# Mergeable statistics per day/state/type, built from the cube so the statistics table never rescans rows
+@st.cache_data
+def load_summaries():
+    return build_cube_summaries(load_cube())
+
+# Day/week/month/year counts and running daily totals per dimension, so any
+# slider range is answered at the grain its width calls for
+@st.cache_resource
+def load_pyramid():
+    return build_pyramid(load_cube())
+
+# Time every stage of this rerun
+start_run('01.py')
+
+# Load the aggregates, and the raw rows for the tables unless the export is too large to load whole
+with stage('load_data') as record:
+    cube = load_cube()
+    summaries = load_summaries()
+    pyramid = load_pyramid()
+    data = None if stream_only('cars_2024.csv') else load_data()
+    record['rows_out'] = len(cube)
 
 # Set the title
 st.title("Vehicle Registration Dashboard")
 
-# Display the dataframe
-st.write(data)
+# Display the dataframe, or the daily counts when the raw rows are not loaded
+paged_table(cube if data is None else data, key='data')
 
 # Convert dates to string for the slider
-min_date = data['date_reg'].min().date()
-max_date = data['date_reg'].max().date()
+first_date, last_date = date_extent(cube)
+min_date = first_date.date()
+max_date = last_date.date()
 
 # Filter data by date
 date_filter = st.slider("Select date range:",
@@ -24,29 +59,55 @@ date_filter = st.slider("Select date range:",
                         max_value=max_date,
                         value=(min_date, max_date))
 
+# Report how much memory the loaded data takes
+st.caption(format_footprint(cube if data is None else data))
+
 # Convert selected dates back to datetime
 start_date = pd.to_datetime(date_filter[0])
 end_date = pd.to_datetime(date_filter[1])
 
-filtered_data = data[(data['date_reg'] >= start_date) & (data['date_reg'] <= end_date)]
+with stage('filter', rows_in=len(cube)) as record:
+    filtered_cube = slice_cube(cube, start_date, end_date)
+    filtered_data = filtered_cube if data is None else date_slice(data, start_date, end_date)
+    record['rows_out'] = len(filtered_cube)
 
-# Display filtered data
-st.write(filtered_data)
+# Display filtered data, or its daily counts when the raw rows are not loaded
+paged_table(filtered_data, key='filtered_data')
 
 # Show statistics
 st.write("Statistics")
-st.write(filtered_data.describe())
+with stage('statistics', rows_in=len(filtered_data)):
+    st.write(describe_selection(summaries, start_date, end_date))
 
 # Plot a histogram of vehicle types
 st.write("Vehicle Types Distribution")
-st.bar_chart(filtered_data['type'].value_counts())
+with stage('aggregate', rows_in=len(filtered_cube)) as record:
+    type_counts = range_counts(pyramid, 'type', start_date, end_date)
+    type_counts = type_counts[type_counts > 0].sort_values(ascending=False)
+    record['rows_out'] = len(type_counts)
+with stage('figure', rows_in=len(type_counts)):
+    st.bar_chart(type_counts)
 
 # Plot a pie chart of vehicle makers
 st.write("Vehicle Makers Distribution")
-fig, ax = plt.subplots()
-filtered_data['maker'].value_counts().plot.pie(autopct='%1.1f%%', ax=ax)
-st.pyplot(fig)
+with stage('aggregate', rows_in=len(filtered_cube)) as record:
+    maker_counts = range_counts(pyramid, 'maker', start_date, end_date)
+    maker_counts = maker_counts[maker_counts > 0].sort_values(ascending=False)
+    record['rows_out'] = len(maker_counts)
+with stage('figure', rows_in=len(maker_counts)):
+    fig, ax = plt.subplots()
+    maker_counts.plot.pie(autopct='%1.1f%%', ax=ax)
+    st.pyplot(fig)
+
+# Plot a line chart of registrations over time, per day, week, month or year depending on the range
+resolution = pick_resolution(start_date, end_date)
+st.write(f"Registrations Over Time (per {LEVEL_NAMES[resolution].lower()})")
+with stage('aggregate', rows_in=len(filtered_cube)) as record:
+    period_counts = time_series(pyramid, start_date, end_date, freq=resolution)
+    record['rows_out'] = len(period_counts)
+with stage('figure', rows_in=len(period_counts)):
+    st.line_chart(period_counts)
 
-# Plot a line chart of registrations over time
-st.write("Registrations Over Time")
-st.line_chart(filtered_data.groupby(filtered_data['date_reg'].dt.to_period('M')).size())
+# Publish this rerun's stage timings
+finish_run()
+debug_panel()
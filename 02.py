@@ -1,36 +1,87 @@
 import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
+from loader import format_footprint, load_registrations, stream_only
+from paged_table import paged_table
+from export import export_button
+from stats_engine import build_cube_summaries, describe_selection
+from row_index import date_extent, date_slice
+from cube import slice_cube, stream_cube
+from kpi import selection_kpis
+from topk import TOP_K, build_topk_index, top_makers
+from instrument import debug_panel, finish_run, stage, start_run
 
-# Load the data
-data = pd.read_csv('cars_2024.csv')
+# Function to load csv data
+@st.cache_data
+def load_data():
+    return load_registrations('cars_2024.csv')
 
-# Convert the date_reg column to datetime
-data['date_reg'] = pd.to_datetime(data['date_reg'])
+# Daily counts per state/type/maker/fuel, streamed from the CSV in chunks
+# so the charts never need the raw rows in memory
+@st.cache_data
+def load_cube():
+    return stream_cube('cars_2024.csv')
+
+# Mergeable statistics per day/state/type, built from the cube so the statistics table never rescans rows
+@st.cache_data
+def load_summaries():
+    return build_cube_summaries(load_cube())
+
+# Info box and distribution KPIs for a date range, recomputed only when the filters change
+@st.cache_data
+def load_kpis(start_date, end_date):
+    return selection_kpis(load_cube(), start_date, end_date)
+
+# Maker counts per month/state/type as prefix sums, so the top makers of any
+# selection are a subtraction plus the days of the partial months at its ends
+@st.cache_resource
+def load_topk_index():
+    return build_topk_index(load_cube())
+
+# Time every stage of this rerun
+start_run('02.py')
+
+# Load the aggregates, and the raw rows for the tables unless the export is too large to load whole
+with stage('load_data') as record:
+    cube = load_cube()
+    topk_index = load_topk_index()
+    summaries = load_summaries()
+    data = None if stream_only('cars_2024.csv') else load_data()
+    record['rows_out'] = len(cube)
 
 # Set the title
 st.title("Vehicle Registration Dashboard")
 
 # Sidebar date filter
 st.sidebar.title("Filter")
-min_date = data['date_reg'].min().date()
-max_date = data['date_reg'].max().date()
+first_date, last_date = date_extent(cube)
+min_date = first_date.date()
+max_date = last_date.date()
 
 date_filter = st.sidebar.slider("Select date range:",
                                 min_value=min_date, 
                                 max_value=max_date,
                                 value=(min_date, max_date))
 
+# Report how much memory the loaded data takes
+st.sidebar.caption(format_footprint(cube if data is None else data))
+
 # Convert selected dates back to datetime
 start_date = pd.to_datetime(date_filter[0])
 end_date = pd.to_datetime(date_filter[1])
 
-filtered_data = data[(data['date_reg'] >= start_date) & (data['date_reg'] <= end_date)]
+with stage('filter', rows_in=len(cube)) as record:
+    filtered_cube = slice_cube(cube, start_date, end_date)
+    filtered_data = filtered_cube if data is None else date_slice(data, start_date, end_date)
+    record['rows_out'] = len(filtered_cube)
 
 # Info boxes
-total_vehicles = filtered_data.shape[0]
-total_petrol = filtered_data[filtered_data['fuel'] == 'petrol'].shape[0]
-total_diesel = filtered_data[filtered_data['fuel'] == 'diesel'].shape[0]
+with stage('aggregate', rows_in=len(filtered_cube)) as record:
+    kpis = load_kpis(start_date, end_date)
+    total_vehicles = kpis['total']
+    total_petrol = kpis['petrol']
+    total_diesel = kpis['diesel']
+    record['rows_out'] = len(kpis)
 
 col1, col2, col3 = st.columns(3)
 col1.metric("Total Vehicles Sales", total_vehicles)
@@ -39,19 +90,30 @@ col3.metric("Total Diesel Vehicles Sales", total_diesel)
 
 # Plot a histogram of vehicle types
 st.write("Vehicle Types Distribution")
-st.bar_chart(filtered_data['type'].value_counts())
+type_counts = kpis['type']
+with stage('figure', rows_in=len(type_counts)):
+    st.bar_chart(type_counts)
 
 # Plot a pie chart of vehicle makers
-st.write("Top 5 Vehicle Makers Distribution")
-top_5_makers = filtered_data['maker'].value_counts().nlargest(5)
-fig, ax = plt.subplots()
-top_5_makers.plot.pie(autopct='%1.1f%%', ax=ax)
-st.pyplot(fig)
+st.write(f"Top {TOP_K} Vehicle Makers Distribution")
+top_5_makers = top_makers(topk_index, TOP_K, start_date, end_date)
+with stage('figure', rows_in=len(top_5_makers)):
+    fig, ax = plt.subplots()
+    top_5_makers.plot.pie(autopct='%1.1f%%', ax=ax)
+    st.pyplot(fig)
 
-# Display the filtered dataframe at the bottom
+# Display the filtered dataframe at the bottom, or its daily counts when the raw rows are not loaded
 st.write("Filtered Data")
-st.write(filtered_data)
+paged_table(filtered_data, key='filtered_data')
+
+# Download the selection as CSV or Parquet, streamed from the export rather than the loaded rows
+export_button('cars_2024.csv', 'filtered_data', start_date, end_date)
 
 # Display statistics at the bottom
 st.write("Statistics")
-st.write(filtered_data.describe())
+with stage('statistics', rows_in=len(filtered_data)):
+    st.write(describe_selection(summaries, start_date, end_date))
+
+# Publish this rerun's stage timings
+finish_run()
+debug_panel()
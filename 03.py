@@ -1,34 +1,88 @@
+import os
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
 from streamlit_option_menu import option_menu
-
-# Function to load parquet data
+from loader import data_version, format_footprint, load_registrations, parquet_source
+from paged_table import paged_table
+from export import export_button
+from shared_data import format_memory_report, load_shared, memory_report
+from stats_engine import build_summaries, describe_selection
+from row_index import date_extent, date_slice
+from query_backend import get_backend
+from kpi import selection_kpis
+from topk import TOP_K, build_topk_index, top_makers
+from time_pyramid import build_pyramid, time_series
+from instrument import debug_panel, finish_run, stage, start_run
+
+# Function to load parquet data, mapped read-only and shared by every session and worker
+@st.cache_resource
+def load_data(source, version):
+    return load_shared('registrations', (os.path.abspath(source), version), lambda: load_registrations(source))
+
+# Mergeable statistics per day/state/type, so the statistics table never rescans rows
 @st.cache_data
-def load_data():
-    return pd.read_parquet('cars.parquet')
+def load_summaries(source, version):
+    return build_summaries(load_data(source, version))
 
-# Load the data
-data = load_data()
+# Build the daily registration count cube once and keep it cached,
+# with DuckDB when installed (see DASHBOARD_BACKEND)
+@st.cache_data
+def load_cube(source, version):
+    return get_backend().cube(source, freq='D')
 
-# Convert the date_reg column to datetime
-data['date_reg'] = pd.to_datetime(data['date_reg'])
+# Info box and distribution KPIs for a date range, recomputed only when the filters change
+@st.cache_data
+def load_kpis(source, version, start_date, end_date):
+    return selection_kpis(load_cube(source, version), start_date, end_date)
+
+# Maker counts per month/state/type as prefix sums, so the top makers of any
+# selection are a subtraction plus the days of the partial months at its ends
+@st.cache_resource
+def load_topk_index(source, version):
+    return build_topk_index(load_cube(source, version))
+
+# Yearly and monthly registration totals, with running daily totals, so the
+# yearly chart reads its grain instead of regrouping the cube every rerun
+@st.cache_resource
+def load_pyramid(source, version):
+    return build_pyramid(load_cube(source, version))
+
+# Time every stage of this rerun
+start_run('03.py')
+
+# Load the data, reloading whenever ingest.py adds a batch
+with stage('load_data') as record:
+    source = parquet_source()
+    version = data_version(source)
+    data = load_data(source, version)
+    cube = load_cube(source, version)
+    topk_index = load_topk_index(source, version)
+    pyramid = load_pyramid(source, version)
+    summaries = load_summaries(source, version)
+    record['rows_out'] = len(data)
 
 # Sidebar date filter
 st.sidebar.title("Filter")
-min_date = data['date_reg'].min().date()
-max_date = data['date_reg'].max().date()
+first_date, last_date = date_extent(data)
+min_date = first_date.date()
+max_date = last_date.date()
 
 date_filter = st.sidebar.slider("Select date range:",
                                 min_value=min_date, 
                                 max_value=max_date,
                                 value=(min_date, max_date))
 
+# Report how much memory the loaded data takes
+st.sidebar.caption(format_footprint(data))
+st.sidebar.caption(format_memory_report(memory_report()))
+
 # Convert selected dates back to datetime
 start_date = pd.to_datetime(date_filter[0])
 end_date = pd.to_datetime(date_filter[1])
 
-filtered_data = data[(data['date_reg'] >= start_date) & (data['date_reg'] <= end_date)]
+with stage('filter', rows_in=len(data)) as record:
+    filtered_data = date_slice(data, start_date, end_date)
+    record['rows_out'] = len(filtered_data)
 
 # Navigation Menu
 selected = option_menu(
@@ -44,20 +98,26 @@ if selected == "Yearly Registration":
     st.title("Yearly Vehicle Registration")
 
     # Group data by year
-    data['year'] = data['date_reg'].dt.year
-    yearly_data = data.groupby('year').size()
+    with stage('aggregate', rows_in=len(pyramid['levels']['Y']['cube'])) as record:
+        yearly_data = time_series(pyramid, freq='Y')
+        yearly_data.index = yearly_data.index.year.rename('year')
+        record['rows_out'] = len(yearly_data)
 
     # Plot line chart
     st.write("Yearly Registered Vehicles")
-    st.line_chart(yearly_data)
+    with stage('figure', rows_in=len(yearly_data)):
+        st.line_chart(yearly_data)
 
 elif selected == "Detailed Analysis":
     st.title("Vehicle Registration Dashboard")
 
     # Info boxes
-    total_vehicles = filtered_data.shape[0]
-    total_petrol = filtered_data[filtered_data['fuel'] == 'petrol'].shape[0]
-    total_diesel = filtered_data[filtered_data['fuel'] == 'diesel'].shape[0]
+    with stage('aggregate', rows_in=len(cube)) as record:
+        kpis = load_kpis(source, version, start_date, end_date)
+        total_vehicles = kpis['total']
+        total_petrol = kpis['petrol']
+        total_diesel = kpis['diesel']
+        record['rows_out'] = len(kpis)
 
     col1, col2, col3 = st.columns(3)
     col1.metric("Total Vehicles Sales", total_vehicles)
@@ -66,19 +126,33 @@ elif selected == "Detailed Analysis":
 
     # Plot a histogram of vehicle types
     st.write("Vehicle Types Distribution")
-    st.bar_chart(filtered_data['type'].value_counts())
+    type_counts = kpis['type']
+    with stage('figure', rows_in=len(type_counts)):
+        st.bar_chart(type_counts)
 
     # Plot a pie chart of vehicle makers
-    st.write("Top 5 Vehicle Makers Distribution")
-    top_5_makers = filtered_data['maker'].value_counts().nlargest(5)
-    fig, ax = plt.subplots()
-    top_5_makers.plot.pie(autopct='%1.1f%%', ax=ax)
-    st.pyplot(fig)
+    st.write(f"Top {TOP_K} Vehicle Makers Distribution")
+    top_5_makers = top_makers(topk_index, TOP_K, start_date, end_date)
+    with stage('figure', rows_in=len(top_5_makers)):
+        # pyplot takes most of a second to import, so sessions that never open this view skip it
+        import matplotlib.pyplot as plt
+        fig, ax = plt.subplots()
+        top_5_makers.plot.pie(autopct='%1.1f%%', ax=ax)
+        st.pyplot(fig)
 
     # Display the filtered dataframe at the bottom
     st.write("Filtered Data")
-    st.write(filtered_data)
+    with stage('table', rows_in=len(filtered_data)):
+        paged_table(filtered_data, key='filtered_data')
+
+    # Download the selection as CSV or Parquet, streamed from the dataset rather than the loaded rows
+    export_button(source, 'filtered_data', start_date, end_date)
 
     # Display statistics at the bottom
     st.write("Statistics")
-    st.write(filtered_data.describe())
+    with stage('statistics', rows_in=len(filtered_data)):
+        st.write(describe_selection(summaries, start_date, end_date))
+
+# Publish this rerun's stage timings
+finish_run()
+debug_panel()
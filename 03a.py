@@ -1,19 +1,67 @@
+import os
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import plotly.graph_objects as go
-from streamlit_option_menu import option_menu
-
-# Function to load parquet data
+from loader import data_version, format_footprint, load_registrations, parquet_source
+from paged_table import paged_table
+from export import export_button
+from shared_data import format_memory_report, load_shared, memory_report
+from stats_engine import build_summaries, describe_selection
+from row_index import date_extent, date_slice
+from query_backend import get_backend
+from kpi import selection_kpis
+from topk import TOP_K, build_topk_index, top_makers
+from time_pyramid import build_pyramid, time_series
+from figure_cache import cached_figure
+from warmup import format_warmup, popular_views, record_request, start_warmup, warmup_status
+from instrument import debug_panel, finish_run, stage, start_run
+
+# Function to load parquet data, mapped read-only and shared by every session and worker
+@st.cache_resource
+def load_data(source, version):
+    return load_shared('registrations', (os.path.abspath(source), version), lambda: load_registrations(source))
+
+# Mergeable statistics per day/state/type, so the statistics table never rescans rows
 @st.cache_data
-def load_data():
-    return pd.read_parquet('cars.parquet')
+def load_summaries(source, version):
+    return build_summaries(load_data(source, version))
 
-# Load the data
-data = load_data()
+# Build the daily registration count cube once and keep it cached,
+# with DuckDB when installed (see DASHBOARD_BACKEND)
+@st.cache_data
+def load_cube(source, version):
+    return get_backend().cube(source, freq='D')
 
-# Convert the date_reg column to datetime
-data['date_reg'] = pd.to_datetime(data['date_reg'])
+# Info box and distribution KPIs for a date range, recomputed only when the filters change
+@st.cache_data
+def load_kpis(source, version, start_date, end_date):
+    return selection_kpis(load_cube(source, version), start_date, end_date)
+
+# Maker counts per month/state/type as prefix sums, so the top makers of any
+# selection are a subtraction plus the days of the partial months at its ends
+@st.cache_resource
+def load_topk_index(source, version):
+    return build_topk_index(load_cube(source, version))
+
+# Yearly and monthly registration totals, with running daily totals, so the
+# yearly chart reads its grain instead of regrouping the cube every rerun
+@st.cache_resource
+def load_pyramid(source, version):
+    return build_pyramid(load_cube(source, version))
+
+# Time every stage of this rerun
+start_run('03a.py')
+
+# Load the data, reloading whenever ingest.py adds a batch
+with stage('load_data') as record:
+    source = parquet_source()
+    version = data_version(source)
+    data = load_data(source, version)
+    cube = load_cube(source, version)
+    topk_index = load_topk_index(source, version)
+    pyramid = load_pyramid(source, version)
+    summaries = load_summaries(source, version)
+    record['rows_out'] = len(data)
 
 # Sidebar
 st.sidebar.title("Malaysia Vehicle Registration")
@@ -26,19 +74,76 @@ selected = st.sidebar.radio(
 
 # Sidebar date filter
 st.sidebar.title("Filter")
-min_date = data['date_reg'].min().date()
-max_date = data['date_reg'].max().date()
+first_date, last_date = date_extent(data)
+min_date = first_date.date()
+max_date = last_date.date()
 
 date_filter = st.sidebar.slider("Select date range:",
                                 min_value=min_date, 
                                 max_value=max_date,
                                 value=(min_date, max_date))
 
+# Report how much memory the loaded data takes
+st.sidebar.caption(format_footprint(data))
+st.sidebar.caption(format_memory_report(memory_report()))
+
 # Convert selected dates back to datetime
 start_date = pd.to_datetime(date_filter[0])
 end_date = pd.to_datetime(date_filter[1])
 
-filtered_data = data[(data['date_reg'] >= start_date) & (data['date_reg'] <= end_date)]
+with stage('filter', rows_in=len(data)) as record:
+    filtered_data = date_slice(data, start_date, end_date)
+    record['rows_out'] = len(filtered_data)
+
+# Group data by year, then plot it as a line chart using Plotly
+def yearly_figure():
+    with stage('aggregate', rows_in=len(pyramid['levels']['Y']['cube'])) as record:
+        yearly_data = time_series(pyramid, freq='Y').reset_index()
+        yearly_data.insert(0, 'year', yearly_data.pop('date_reg').dt.year)
+        record['rows_out'] = len(yearly_data)
+
+    with stage('figure', rows_in=len(yearly_data)):
+        fig = px.line(yearly_data, x='year', y='count', labels={'year': 'Year', 'count': 'Number of Vehicles'}, title='Yearly Registered Vehicles')
+        fig.update_layout(xaxis=dict(tickmode='linear'))
+        return fig
+
+# Bar chart of the vehicle types among a date range's KPIs
+def types_figure(kpis):
+    type_counts = kpis['type'].reset_index()
+    type_counts.columns = ['type', 'count']
+    with stage('figure', rows_in=len(type_counts)):
+        return px.bar(type_counts, x='type', y='count', labels={'type': 'Vehicle Type', 'count': 'Number of Vehicles'}, title='Vehicle Types Distribution')
+
+# Pie chart of the top makers in a date range
+def top_makers_figure(start_date, end_date):
+    top_5_makers = top_makers(topk_index, TOP_K, start_date, end_date).reset_index()
+    top_5_makers.columns = ['maker', 'count']
+    with stage('figure', rows_in=len(top_5_makers)):
+        return px.pie(top_5_makers, values='count', names='maker', title=f'Top {TOP_K} Vehicle Makers Distribution', hole=0.3)
+
+# KPIs and distribution charts of the Detailed Analysis view for a date range
+def warm_detailed_view(start_date, end_date):
+    kpis = load_kpis(source, version, start_date, end_date)
+    cached_figure('03a.types', (start_date, end_date), (source, version), lambda: types_figure(kpis))
+    cached_figure('03a.top_makers', (start_date, end_date), (source, version), lambda: top_makers_figure(start_date, end_date))
+
+# Warm the default views in the background once per data version, so the first
+# sessions after a deploy or an ingest.py batch find them cached: Detailed Analysis
+# over the full date range and the most requested ranges, then the yearly view,
+# which the session that starts the warm-up usually renders itself
+default_view = ("Detailed Analysis", str(pd.Timestamp(min_date)), str(pd.Timestamp(max_date)))
+detailed_views = [default_view] + [view for view in popular_views('03a.py')
+                                   if view[0] == "Detailed Analysis" and view != default_view]
+warmup_tasks = []
+for view in detailed_views:
+    warmup_tasks.append((f"Detailed Analysis {view[1][:10]} to {view[2][:10]}", view,
+                         lambda view=view: warm_detailed_view(pd.Timestamp(view[1]), pd.Timestamp(view[2]))))
+warmup_tasks.append(('yearly chart', ('Yearly Registration',), lambda: cached_figure('03a.yearly', (), (source, version), yearly_figure)))
+start_warmup('03a.py', (source, version), warmup_tasks)
+
+# Count this view, and report how the warm-up is doing
+record_request('03a.py', (selected,) if selected == "Yearly Registration" else (selected, start_date, end_date))
+st.sidebar.caption(format_warmup(warmup_status('03a.py')))
 
 # CSS for infobox style
 st.markdown("""
@@ -63,22 +168,21 @@ st.markdown("""
 if selected == "Yearly Registration":
     st.title("Yearly Vehicle Registration")
 
-    # Group data by year
-    data['year'] = data['date_reg'].dt.year
-    yearly_data = data.groupby('year').size().reset_index(name='count')
-
-    # Plot line chart using Plotly
-    fig = px.line(yearly_data, x='year', y='count', labels={'year': 'Year', 'count': 'Number of Vehicles'}, title='Yearly Registered Vehicles')
-    fig.update_layout(xaxis=dict(tickmode='linear'))
+    # Reuse the figure of an earlier rerun until ingest.py adds a batch
+    with stage('figure_cache'):
+        fig = cached_figure('03a.yearly', (), (source, version), yearly_figure)
     st.plotly_chart(fig)
 
 elif selected == "Detailed Analysis":
     st.title("Vehicle Registration Dashboard")
 
     # Info boxes
-    total_vehicles = f"{filtered_data.shape[0]:,}"
-    total_petrol = f"{filtered_data[filtered_data['fuel'] == 'petrol'].shape[0]:,}"
-    total_diesel = f"{filtered_data[filtered_data['fuel'] == 'diesel'].shape[0]:,}"
+    with stage('aggregate', rows_in=len(cube)) as record:
+        kpis = load_kpis(source, version, start_date, end_date)
+        total_vehicles = f"{kpis['total']:,}"
+        total_petrol = f"{kpis['petrol']:,}"
+        total_diesel = f"{kpis['diesel']:,}"
+        record['rows_out'] = len(kpis)
 
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -90,22 +194,30 @@ elif selected == "Detailed Analysis":
 
     # Plot a histogram of vehicle types using Plotly
     st.write("Vehicle Types Distribution")
-    type_counts = filtered_data['type'].value_counts().reset_index()
-    type_counts.columns = ['type', 'count']
-    fig = px.bar(type_counts, x='type', y='count', labels={'type': 'Vehicle Type', 'count': 'Number of Vehicles'}, title='Vehicle Types Distribution')
+    with stage('figure_cache'):
+        fig = cached_figure('03a.types', (start_date, end_date), (source, version), lambda: types_figure(kpis))
     st.plotly_chart(fig)
 
     # Plot a pie chart of vehicle makers using Plotly
-    st.write("Top 5 Vehicle Makers Distribution")
-    top_5_makers = filtered_data['maker'].value_counts().nlargest(5).reset_index()
-    top_5_makers.columns = ['maker', 'count']
-    fig = px.pie(top_5_makers, values='count', names='maker', title='Top 5 Vehicle Makers Distribution', hole=0.3)
+    st.write(f"Top {TOP_K} Vehicle Makers Distribution")
+    with stage('figure_cache'):
+        fig = cached_figure('03a.top_makers', (start_date, end_date), (source, version),
+                            lambda: top_makers_figure(start_date, end_date))
     st.plotly_chart(fig)
 
     # Display the filtered dataframe at the bottom
     st.write("Filtered Data")
-    st.write(filtered_data)
+    with stage('table', rows_in=len(filtered_data)):
+        paged_table(filtered_data, key='filtered_data')
+
+    # Download the selection as CSV or Parquet, streamed from the dataset rather than the loaded rows
+    export_button(source, 'filtered_data', start_date, end_date)
 
     # Display statistics at the bottom
     st.write("Statistics")
-    st.write(filtered_data.describe())
+    with stage('statistics', rows_in=len(filtered_data)):
+        st.write(describe_selection(summaries, start_date, end_date))
+
+# Publish this rerun's stage timings
+finish_run()
+debug_panel()
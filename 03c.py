@@ -1,20 +1,88 @@
+import os
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from prophet import Prophet
-from prophet.plot import plot_plotly, plot_components_plotly
-from streamlit_option_menu import option_menu
+from loader import data_version, format_footprint, parquet_source, scan_registrations
+from parquet_scan import format_scan_report
+from paged_table import paged_table
+from export import export_button
+from shared_data import format_memory_report, load_shared, memory_report
+from stats_engine import build_summaries, describe_selection
+from row_index import date_extent, date_slice
+from query_backend import get_backend
+from kpi import selection_kpis
+from topk import TOP_K, build_topk_index, top_makers
+from time_pyramid import build_pyramid, time_series
+from figure_cache import cached_figure
+from warmup import format_warmup, popular_views, record_request, start_warmup, warmup_status
+from instrument import debug_panel, finish_run, stage, start_run
+from forecast_store import cached_forecast, store_stats
+from batch_forecast import SEGMENT_FORECASTS_PATH, load_segment_forecasts
 
-# Function to load parquet data
+# Function to load every column of the 2024 rows shown in Detailed Analysis,
+# mapped read-only and shared by every session and worker
+@st.cache_resource
+def load_data_2024(source, version):
+    def scan():
+        data, report = scan_registrations(source, start_date='2024-01-01', end_date='2024-12-31')
+        data.attrs['scan'] = report
+        return data
+
+    data = load_shared('registrations-2024', (os.path.abspath(source), version), scan)
+    return data, data.attrs['scan']
+
+# Mergeable statistics per day/state/type of the 2024 rows, so the statistics table never rescans rows
+@st.cache_data
+def load_summaries_2024(source, version):
+    return build_summaries(load_data_2024(source, version)[0])
+
+# Build the daily registration count cube once and keep it cached,
+# with DuckDB when installed (see DASHBOARD_BACKEND)
+@st.cache_data
+def load_cube(source, version):
+    return get_backend().cube(source, freq='D')
+
+# Monthly registrations since 2018 as the ds/y series Prophet fits,
+# so reruns of the forecast view skip the aggregation
+@st.cache_data
+def load_monthly_series(source, version):
+    monthly_data = time_series(load_pyramid(source, version), start_date='2018-01-01', freq='M').reset_index()
+    return monthly_data.rename(columns={'date_reg': 'ds', 'count': 'y'})
+
+# Precomputed segment forecasts, reloaded whenever batch_forecast.py rewrites them
 @st.cache_data
-def load_data():
-    return pd.read_parquet('cars.parquet')
+def load_segment_forecast_table(modified_time):
+    return load_segment_forecasts()
 
-# Load the data
-data = load_data()
+# Info box and distribution KPIs of the 2024 registrations in a date range,
+# recomputed only when the filters change
+@st.cache_data
+def load_kpis_2024(source, version, start_date, end_date):
+    return selection_kpis(load_cube(source, version), start_date, end_date, year=2024)
+
+# Maker counts per month/state/type as prefix sums, so the top makers of any
+# selection are a subtraction plus the days of the partial months at its ends
+@st.cache_resource
+def load_topk_index(source, version):
+    return build_topk_index(load_cube(source, version))
+
+# Yearly and monthly registration totals, with running daily totals, so the
+# yearly chart reads its grain instead of regrouping the cube every rerun
+@st.cache_resource
+def load_pyramid(source, version):
+    return build_pyramid(load_cube(source, version))
+
+# Time every stage of this rerun
+start_run('03c.py')
 
-# Convert the date_reg column to datetime
-data['date_reg'] = pd.to_datetime(data['date_reg'])
+# Load the data, reloading whenever ingest.py adds a batch
+with stage('load_data') as record:
+    source = parquet_source()
+    version = data_version(source)
+    cube = load_cube(source, version)
+    topk_index = load_topk_index(source, version)
+    pyramid = load_pyramid(source, version)
+    record['rows_out'] = len(cube)
 
 # Sidebar
 st.sidebar.title("Malaysia Vehicle Registration")
@@ -27,19 +95,97 @@ selected = st.sidebar.radio(
 
 # Sidebar date filter
 st.sidebar.title("Filter")
-min_date = data['date_reg'].min().date()
-max_date = data['date_reg'].max().date()
+first_date, last_date = date_extent(cube)
+min_date = first_date.date()
+max_date = last_date.date()
 
 date_filter = st.sidebar.slider("Select date range:",
                                 min_value=min_date, 
                                 max_value=max_date,
                                 value=(min_date, max_date))
 
+# Report how much memory the cached cube takes
+st.sidebar.caption(format_footprint(cube))
+st.sidebar.caption(format_memory_report(memory_report()))
+
 # Convert selected dates back to datetime
 start_date = pd.to_datetime(date_filter[0])
 end_date = pd.to_datetime(date_filter[1])
 
-filtered_data = data[(data['date_reg'] >= start_date) & (data['date_reg'] <= end_date)]
+# Group data by year and filter out 2024, then plot it as a line chart using Plotly
+def yearly_figure():
+    with stage('aggregate', rows_in=len(pyramid['levels']['Y']['cube'])) as record:
+        yearly_data = time_series(pyramid, freq='Y').reset_index()
+        yearly_data.insert(0, 'year', yearly_data.pop('date_reg').dt.year)
+        yearly_data = yearly_data[yearly_data['year'] != 2024]
+        record['rows_out'] = len(yearly_data)
+
+    with stage('figure', rows_in=len(yearly_data)):
+        fig = px.line(yearly_data, x='year', y='count', labels={'year': 'Year', 'count': 'Number of Vehicles'}, title='Yearly Registered Vehicles')
+        fig.update_layout(xaxis=dict(tickmode='linear', tickangle=60))
+        return fig
+
+# Bar chart of the vehicle types among a date range's KPIs
+def types_figure(kpis):
+    type_counts = kpis['type'].reset_index()
+    type_counts.columns = ['type', 'count']
+    with stage('figure', rows_in=len(type_counts)):
+        return px.bar(type_counts, x='type', y='count', labels={'type': 'Vehicle Type', 'count': 'Number of Vehicles'}, title='Vehicle Types Distribution')
+
+# Pie chart of the top makers in a date range
+def top_makers_figure(start_date, end_date):
+    top_5_makers = top_makers(topk_index, TOP_K, start_date, end_date, year=2024).reset_index()
+    top_5_makers.columns = ['maker', 'count']
+    with stage('figure', rows_in=len(top_5_makers)):
+        return px.pie(top_5_makers, values='count', names='maker', title=f'Top {TOP_K} Vehicle Makers Distribution', hole=0.3)
+
+# Prophet's forecast chart, with its history and uncertainty band
+def forecast_figure(model, forecast):
+    with stage('figure', rows_in=len(forecast)):
+        from prophet.plot import plot_plotly
+        forecast_fig = plot_plotly(model, forecast)
+        forecast_fig.update_layout(xaxis=dict(tickmode='linear', tickangle=60))
+        return forecast_fig
+
+# Trend and seasonality components of a Prophet forecast
+def seasonal_figure(model, forecast):
+    with stage('figure', rows_in=len(forecast)):
+        from prophet.plot import plot_components_plotly
+        return plot_components_plotly(model, forecast)
+
+# Fit (or load) the forecast and build its charts, as the yearly view does
+def warm_forecast():
+    model, forecast = cached_forecast(load_monthly_series(source, version), {'periods': 24, 'freq': 'MS'})
+    cached_figure('03c.forecast', (24, 'MS'), (source, version), lambda: forecast_figure(model, forecast))
+    cached_figure('03c.seasonal', (24, 'MS'), (source, version), lambda: seasonal_figure(model, forecast))
+
+# KPIs and distribution charts of the Detailed Analysis view for a date range
+def warm_detailed_view(start_date, end_date):
+    kpis = load_kpis_2024(source, version, start_date, end_date)
+    cached_figure('03c.types', (start_date, end_date), (source, version), lambda: types_figure(kpis))
+    cached_figure('03c.top_makers', (start_date, end_date), (source, version), lambda: top_makers_figure(start_date, end_date))
+
+# Warm the default views in the background once per data version, so the first
+# sessions after a deploy or an ingest.py batch find them cached: Detailed Analysis
+# over the full date range and the most requested ranges, then the yearly view,
+# which the session that starts the warm-up usually renders itself
+default_view = ("Detailed Analysis", str(pd.Timestamp(min_date)), str(pd.Timestamp(max_date)))
+detailed_views = [default_view] + [view for view in popular_views('03c.py')
+                                   if view[0] == "Detailed Analysis" and view != default_view]
+warmup_tasks = [
+    ('2024 rows', None, lambda: load_data_2024(source, version)),
+    ('statistics', None, lambda: load_summaries_2024(source, version)),
+]
+for view in detailed_views:
+    warmup_tasks.append((f"Detailed Analysis {view[1][:10]} to {view[2][:10]}", view,
+                         lambda view=view: warm_detailed_view(pd.Timestamp(view[1]), pd.Timestamp(view[2]))))
+warmup_tasks.append(('yearly chart', None, lambda: cached_figure('03c.yearly', (), (source, version), yearly_figure)))
+warmup_tasks.append(('forecast', ('Yearly Registration',), warm_forecast))
+start_warmup('03c.py', (source, version), warmup_tasks)
+
+# Count this view, and report how the warm-up is doing
+record_request('03c.py', (selected,) if selected == "Yearly Registration" else (selected, start_date, end_date))
+st.sidebar.caption(format_warmup(warmup_status('03c.py')))
 
 # CSS for infobox style
 st.markdown("""
@@ -69,39 +215,37 @@ st.markdown("""
 if selected == "Yearly Registration":
     st.title("Yearly Vehicle Registration")
 
-    # Group data by year and filter out 2024
-    data['year'] = data['date_reg'].dt.year
-    yearly_data = data[data['year'] != 2024].groupby('year').size().reset_index(name='count')
-
-    # Plot line chart using Plotly
-    fig = px.line(yearly_data, x='year', y='count', labels={'year': 'Year', 'count': 'Number of Vehicles'}, title='Yearly Registered Vehicles')
-    fig.update_layout(xaxis=dict(tickmode='linear', tickangle=60))
+    # Reuse the figure of an earlier rerun until ingest.py adds a batch
+    with stage('figure_cache'):
+        fig = cached_figure('03c.yearly', (), (source, version), yearly_figure)
     st.plotly_chart(fig)
 
     # Forecasting with Prophet
-    monthly_data = data[data['year'] >= 2018].groupby(data['date_reg'].dt.to_period('M')).size().reset_index(name='count')
-    monthly_data['date_reg'] = monthly_data['date_reg'].dt.to_timestamp()
-
-    # Prepare data for Prophet
-    prophet_data = monthly_data.rename(columns={'date_reg': 'ds', 'count': 'y'})
+    with stage('aggregate', rows_in=len(cube)) as record:
+        prophet_data = load_monthly_series(source, version)
+        record['rows_out'] = len(prophet_data)
 
-    # Initialize and fit Prophet model
-    model = Prophet()
-    model.fit(prophet_data)
+    # Reuse the stored model and forecast unless the monthly series changed
+    with stage('forecast', rows_in=len(prophet_data)) as record:
+        model, forecast = cached_forecast(prophet_data, {'periods': 24, 'freq': 'MS'})
+        record['rows_out'] = len(forecast)
 
-    # Create future dataframe and forecast
-    future = model.make_future_dataframe(periods=24, freq='M')
-    forecast = model.predict(future)
+    # Report how often the forecast store saved a refit
+    stats = store_stats()
+    st.sidebar.caption(f"Forecast cache: {stats['hits']:,} hits, {stats['misses']:,} misses, "
+                       f"{stats['fit_seconds']:.1f}s fitting, {stats['saved_seconds']:.1f}s saved")
 
     # Plot forecast
     st.write("Vehicle Registration Forecast")
-    forecast_fig = plot_plotly(model, forecast)
-    forecast_fig.update_layout(xaxis=dict(tickmode='linear', tickangle=60))
+    # plot_plotly is slow, so reuse its figure until ingest.py adds a batch
+    with stage('figure_cache'):
+        forecast_fig = cached_figure('03c.forecast', (24, 'MS'), (source, version), lambda: forecast_figure(model, forecast))
     st.plotly_chart(forecast_fig)
 
     # Plot seasonal decomposition
     st.write("Seasonal Decomposition")
-    seasonal_fig = plot_components_plotly(model, forecast)
+    with stage('figure_cache'):
+        seasonal_fig = cached_figure('03c.seasonal', (24, 'MS'), (source, version), lambda: seasonal_figure(model, forecast))
     st.plotly_chart(seasonal_fig)
 
     # Display forecast table at the bottom
@@ -109,16 +253,36 @@ if selected == "Yearly Registration":
     forecast_table = forecast[['ds', 'yhat', 'yhat_upper', 'yhat_lower']]
     st.write(forecast_table)
 
+    # Display precomputed forecasts per maker, state or type
+    if os.path.exists(SEGMENT_FORECASTS_PATH):
+        segment_forecasts = load_segment_forecast_table(os.path.getmtime(SEGMENT_FORECASTS_PATH))
+        st.write("Segment Forecasts")
+        segment_by = st.selectbox("Forecast by:", options=segment_forecasts['segment_by'].unique())
+        segment_forecasts = segment_forecasts[segment_forecasts['segment_by'] == segment_by]
+        segment = st.selectbox(f"Select {segment_by}:", options=segment_forecasts['segment'].unique())
+        segment_fig = px.line(segment_forecasts[segment_forecasts['segment'] == segment], x='ds', y=['yhat', 'yhat_upper', 'yhat_lower'],
+                              labels={'ds': 'Month', 'value': 'Number of Vehicles'}, title=f"Registration Forecast for {segment}")
+        st.plotly_chart(segment_fig)
+
 elif selected == "Detailed Analysis":
     st.title("Vehicle Registration Dashboard")
 
-    # Filtered data for the year 2024
-    filtered_data_2024 = filtered_data[filtered_data['date_reg'].dt.year == 2024]
+    # Filtered data for the year 2024, with the year pushed down to the Parquet reader
+    with stage('load_data') as record:
+        data_2024, data_2024_scan = load_data_2024(source, version)
+        record['rows_out'] = len(data_2024)
+    with stage('filter', rows_in=len(data_2024)) as record:
+        filtered_data_2024 = date_slice(data_2024, start_date, end_date)
+        record['rows_out'] = len(filtered_data_2024)
+    st.sidebar.caption(format_scan_report(data_2024_scan))
 
     # Info boxes
-    total_vehicles = f"{filtered_data_2024.shape[0]:,}"
-    total_petrol = f"{filtered_data_2024[filtered_data_2024['fuel'] == 'petrol'].shape[0]:,}"
-    total_diesel = f"{filtered_data_2024[filtered_data_2024['fuel'] == 'diesel'].shape[0]:,}"
+    with stage('aggregate', rows_in=len(cube)) as record:
+        kpis = load_kpis_2024(source, version, start_date, end_date)
+        total_vehicles = f"{kpis['total']:,}"
+        total_petrol = f"{kpis['petrol']:,}"
+        total_diesel = f"{kpis['diesel']:,}"
+        record['rows_out'] = len(kpis)
 
     st.markdown(f"""
         <div class="infobox-container">
@@ -130,22 +294,31 @@ elif selected == "Detailed Analysis":
 
     # Plot a histogram of vehicle types using Plotly
     st.write("Vehicle Types Distribution")
-    type_counts = filtered_data_2024['type'].value_counts().reset_index()
-    type_counts.columns = ['type', 'count']
-    fig = px.bar(type_counts, x='type', y='count', labels={'type': 'Vehicle Type', 'count': 'Number of Vehicles'}, title='Vehicle Types Distribution')
+    with stage('figure_cache'):
+        fig = cached_figure('03c.types', (start_date, end_date), (source, version), lambda: types_figure(kpis))
     st.plotly_chart(fig)
 
     # Plot a pie chart of vehicle makers using Plotly
-    st.write("Top 5 Vehicle Makers Distribution")
-    top_5_makers = filtered_data_2024['maker'].value_counts().nlargest(5).reset_index()
-    top_5_makers.columns = ['maker', 'count']
-    fig = px.pie(top_5_makers, values='count', names='maker', title='Top 5 Vehicle Makers Distribution', hole=0.3)
+    st.write(f"Top {TOP_K} Vehicle Makers Distribution")
+    with stage('figure_cache'):
+        fig = cached_figure('03c.top_makers', (start_date, end_date), (source, version),
+                            lambda: top_makers_figure(start_date, end_date))
     st.plotly_chart(fig)
 
     # Display the filtered dataframe at the bottom
     st.write("Filtered Data")
-    st.write(filtered_data_2024)
+    with stage('table', rows_in=len(filtered_data_2024)):
+        paged_table(filtered_data_2024, key='filtered_data_2024')
+
+    # Download the selection as CSV or Parquet, streamed from the dataset rather than the loaded rows
+    export_button(source, 'filtered_data_2024', max(start_date, pd.Timestamp('2024-01-01')),
+                  min(end_date, pd.Timestamp('2024-12-31')))
 
     # Display statistics at the bottom
     st.write("Statistics")
-    st.write(filtered_data_2024.describe())
+    with stage('statistics', rows_in=len(filtered_data_2024)):
+        st.write(describe_selection(load_summaries_2024(source, version), start_date, end_date))
+
+# Publish this rerun's stage timings
+finish_run()
+debug_panel()
@@ -0,0 +1,83 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from loader import load_registrations, parquet_source
+from cube import CUBE_DIMENSIONS, build_cube
+from forecast_store import DEFAULT_PARAMS, cached_forecast
+
+# Where the combined segment forecast table is written
+SEGMENT_FORECASTS_PATH = 'segment_forecasts.parquet'
+
+# Columns a forecast can be broken down by
+SEGMENT_COLUMNS = ['maker', 'state', 'type']
+
+# Columns kept from each Prophet forecast, as shown in 03c.py
+FORECAST_COLUMNS = ['ds', 'yhat', 'yhat_upper', 'yhat_lower']
+
+
+# Monthly ds/y series for every value of a segment column, as in 03c.py
+def segment_series(cube, by, start_year=2018, min_months=12):
+    recent = cube[cube['year'] >= start_year]
+    monthly = recent.groupby([by, 'date_reg'], observed=True)['count'].sum()
+
+    # Fill months without registrations so every series is evenly spaced
+    months = pd.date_range(recent['date_reg'].min(), recent['date_reg'].max(), freq='MS')
+    for segment, counts in monthly.groupby(level=0, observed=True):
+        counts = counts.droplevel(0)
+        if (counts > 0).sum() < min_months:
+            continue
+        history = counts.reindex(months, fill_value=0).rename_axis('ds').reset_index(name='y')
+        yield str(segment), history
+
+
+# Forecast one segment series in a worker process
+def _forecast_segment(task):
+    by, segment, history, params = task
+    _, forecast = cached_forecast(history, params)
+    forecast = forecast[FORECAST_COLUMNS].copy()
+    forecast.insert(0, 'segment', segment)
+    forecast.insert(0, 'segment_by', by)
+    return forecast
+
+
+# Forecast every segment of the given columns across a process pool
+def forecast_segments(cube, by=SEGMENT_COLUMNS, params=None, max_workers=None):
+    params = dict(DEFAULT_PARAMS, **(params or {}))
+    tasks = [(column, segment, history, params)
+             for column in by
+             for segment, history in segment_series(cube, column)]
+    if not tasks:
+        return pd.DataFrame(columns=['segment_by', 'segment'] + FORECAST_COLUMNS)
+
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        forecasts = list(executor.map(_forecast_segment, tasks))
+    return pd.concat(forecasts, ignore_index=True)
+
+
+# Precomputed segment forecasts for the dashboard, or None if not built yet
+def load_segment_forecasts(path=SEGMENT_FORECASTS_PATH):
+    if not os.path.exists(path):
+        return None
+    return pd.read_parquet(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Forecast monthly registrations per maker, state and type")
+    parser.add_argument('--data', default=parquet_source(), help="registration data to forecast from")
+    parser.add_argument('--by', nargs='+', default=SEGMENT_COLUMNS, choices=SEGMENT_COLUMNS, help="segment columns")
+    parser.add_argument('--periods', type=int, default=DEFAULT_PARAMS['periods'], help="months to forecast")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--out', default=SEGMENT_FORECASTS_PATH, help="output parquet file")
+    args = parser.parse_args()
+
+    cube = build_cube(load_registrations(args.data, columns=['date_reg'] + CUBE_DIMENSIONS), freq='M')
+
+    started = time.perf_counter()
+    forecasts = forecast_segments(cube, by=args.by, params={'periods': args.periods}, max_workers=args.workers)
+    forecasts.to_parquet(args.out, index=False)
+
+    segments = forecasts.groupby('segment_by')['segment'].nunique()
+    print(f"Forecast {segments.sum()} segments ({', '.join(f'{n} by {by}' for by, n in segments.items())}) "
+          f"in {time.perf_counter() - started:.1f}s, written to {args.out}")
@@ -0,0 +1,301 @@
+import argparse
+import datetime
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from loader import load_registrations
+from row_index import date_slice
+from cube import build_cube, count_by, slice_cube, value_counts
+
+# Directory the repository's scripts live in
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Row counts benchmarked when none are given
+DEFAULT_SIZES = [1_000_000, 10_000_000, 100_000_000]
+
+# Rows generated and written per Parquet row group
+CHUNK_ROWS = 1_000_000
+
+# Results of every run, one JSON object per stage, keyed by git revision
+RESULTS_FILE = 'benchmarks.jsonl'
+
+# Streamlit dashboards run headlessly, in the order of the repository
+STREAMLIT_APPS = ['002.py', '003.py', '01.py', '02.py', '03.py', '03a.py', '03b.py', '03c.py']
+
+# Streamlit dashboards with a sidebar switch to the Detailed Analysis view
+DETAILED_APPS = ['03a.py', '03b.py', '03c.py']
+
+# Slowdown against the previous revision reported as a regression
+REGRESSION_THRESHOLD = 1.2
+
+# Category values and their shares, shaped like the real registration data
+STATES = ['Selangor', 'Johor', 'W.P. Kuala Lumpur', 'Perak', 'Pulau Pinang', 'Sabah', 'Sarawak', 'Kedah',
+          'Negeri Sembilan', 'Pahang', 'Melaka', 'Kelantan', 'Terengganu', 'Perlis', 'W.P. Putrajaya', 'W.P. Labuan']
+STATE_SHARES = [.24, .13, .11, .08, .07, .06, .06, .05, .04, .04, .04, .03, .02, .01, .01, .01]
+TYPES = ['motokar', 'motosikal', 'jip', 'pick_up', 'window_van', 'motokar_pelbagai_utiliti']
+TYPE_SHARES = [.52, .34, .05, .05, .02, .02]
+MAKERS = ['Perodua', 'Proton', 'Honda', 'Toyota', 'Yamaha', 'Nissan', 'Mitsubishi', 'Mazda', 'BMW',
+          'Mercedes Benz', 'Isuzu', 'Ford', 'Hyundai', 'Kia', 'Suzuki', 'Modenas', 'Volkswagen']
+MAKER_SHARES = [.22, .16, .12, .1, .1, .05, .04, .03, .03, .03, .03, .02, .02, .02, .01, .01, .01]
+MODELS = ['Myvi', 'Axia', 'Bezza', 'Saga', 'Persona', 'City', 'Civic', 'Vios', 'Hilux', 'Y15', 'LC135', 'X50',
+          'CX-5', '3 Series', 'C-Class', 'D-Max', 'Ranger', 'Almera', 'Triton', 'Other']
+COLOURS = ['white', 'black', 'silver', 'grey', 'red', 'blue', 'brown', 'other']
+FUELS = ['petrol', 'diesel', 'hybrid_petrol', 'electric', 'greendiesel', 'hybrid_diesel']
+FUEL_SHARES = [.8, .14, .04, .01, .005, .005]
+
+
+# One chunk of synthetic registrations with the schema of cars.parquet,
+# registrations growing over the years and a few unparseable dates
+def synthetic_chunk(rng, rows, start='2000-01-01', end='2024-12-31'):
+    first, last = pd.Timestamp(start), pd.Timestamp(end)
+    span = (last - first).days + 1
+    days = (np.sqrt(rng.random(rows)) * span).astype(np.int64)
+    dates = (np.datetime64(first.date(), 'D') + days).astype(str).astype(object)
+    dates[rng.random(rows) < 1e-4] = None
+    return pa.table({
+        'date_reg': pa.array(dates, pa.string()),
+        'type': pa.DictionaryArray.from_arrays(rng.choice(len(TYPES), rows, p=TYPE_SHARES).astype(np.int32), TYPES),
+        'maker': pa.DictionaryArray.from_arrays(rng.choice(len(MAKERS), rows, p=MAKER_SHARES).astype(np.int32), MAKERS),
+        'model': pa.DictionaryArray.from_arrays(rng.integers(0, len(MODELS), rows, dtype=np.int32), MODELS),
+        'colour': pa.DictionaryArray.from_arrays(rng.integers(0, len(COLOURS), rows, dtype=np.int32), COLOURS),
+        'fuel': pa.DictionaryArray.from_arrays(rng.choice(len(FUELS), rows, p=FUEL_SHARES).astype(np.int32), FUELS),
+        'state': pa.DictionaryArray.from_arrays(rng.choice(len(STATES), rows, p=STATE_SHARES).astype(np.int32), STATES),
+    })
+
+
+# Write cars.parquet and cars_2024.csv with the given number of rows,
+# one chunk at a time so 100M rows never have to fit in memory
+def generate_dataset(out_dir, rows, chunk_rows=CHUNK_ROWS, seed=0):
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    parquet_path = os.path.join(out_dir, 'cars.parquet')
+    csv_path = os.path.join(out_dir, 'cars_2024.csv')
+
+    writer = None
+    with open(csv_path, 'w', newline='') as csv_file:
+        for offset in range(0, rows, chunk_rows):
+            chunk = synthetic_chunk(rng, min(chunk_rows, rows - offset))
+            if writer is None:
+                writer = pq.ParquetWriter(parquet_path, chunk.schema)
+            writer.write_table(chunk, row_group_size=chunk_rows)
+
+            # The Dash app and the 2024-only dashboards read the year's rows from CSV
+            rows_2024 = chunk.to_pandas()
+            rows_2024 = rows_2024[rows_2024['date_reg'].str.startswith('2024', na=False)]
+            rows_2024.to_csv(csv_file, index=False, header=offset == 0)
+    writer.close()
+    return parquet_path, csv_path
+
+
+# Time a stage, keeping its result for the stages that follow
+def timed(results, stage, function, *args, **kwargs):
+    started = time.perf_counter()
+    try:
+        value = function(*args, **kwargs)
+    except Exception as error:
+        results.append({'stage': stage, 'seconds': time.perf_counter() - started, 'error': repr(error)})
+        return None
+    results.append({'stage': stage, 'seconds': time.perf_counter() - started})
+    return value
+
+
+# Time the stages every dashboard script performs on cars.parquet
+def benchmark_stages(parquet_path, forecast=True):
+    results = []
+    raw = _required(results, timed(results, 'read', pd.read_parquet, parquet_path, columns=['date_reg']))
+    timed(results, 'date_parse', pd.to_datetime, raw['date_reg'], errors='coerce')
+    del raw
+
+    data = _required(results, timed(results, 'load', load_registrations, parquet_path))
+    first, last = data['date_reg'].iloc[0], data['date_reg'].dropna().iloc[-1]
+    start_date, end_date = first + (last - first) / 4, last - (last - first) / 4
+
+    # The slider filter, as a boolean mask like the original scripts and as a sorted slice
+    timed(results, 'filter_mask', lambda frame: frame[(frame['date_reg'] >= start_date) & (frame['date_reg'] <= end_date)], data)
+    filtered_data = _required(results, timed(results, 'filter_slice', date_slice, data, start_date, end_date))
+    timed(results, 'value_counts', lambda frame: frame['maker'].value_counts(), filtered_data)
+    timed(results, 'groupby_year_maker', lambda frame: frame.groupby(['year', 'maker'], observed=True).size(), filtered_data)
+    timed(results, 'top_makers', lambda frame: frame['maker'].value_counts().nlargest(5), filtered_data)
+
+    cube = _required(results, timed(results, 'build_cube', build_cube, data, 'D'))
+    del data, filtered_data
+    filtered_cube = _required(results, timed(results, 'slice_cube', slice_cube, cube, start_date, end_date))
+    timed(results, 'cube_value_counts', value_counts, filtered_cube, 'maker')
+    yearly_counts = timed(results, 'cube_groupby_year_maker',
+                          lambda cells: count_by(cells, ['year', 'maker']).reset_index(name='count'), filtered_cube)
+    timed(results, 'cube_top_makers', lambda cells: value_counts(cells, 'maker').head(5), filtered_cube)
+    if yearly_counts is not None:
+        timed(results, 'figure_build', lambda counts: _bar_figure(counts).to_json(), yearly_counts)
+
+    if forecast:
+        monthly = count_by(cube, 'date_reg').resample('MS').sum().reset_index()
+        timed(results, 'prophet_fit', _fit, monthly.set_axis(['ds', 'y'], axis=1))
+    return results
+
+
+# Time each Streamlit dashboard headlessly and the Dash callbacks of 001.py,
+# with cold caches, from a directory holding cars.parquet and cars_2024.csv
+def benchmark_apps(data_dir, apps=None):
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    # Time the views cold, without background warm-ups filling the caches
+    os.environ['DASHBOARD_WARMUP'] = '0'
+
+    results = []
+    previous_dir = os.getcwd()
+    os.chdir(data_dir)
+    try:
+        for app in apps or STREAMLIT_APPS + ['001.py']:
+            st.cache_data.clear()
+            st.cache_resource.clear()
+            if app == '001.py':
+                results.extend(_benchmark_dash(os.path.join(REPO_DIR, app)))
+                continue
+
+            started = time.perf_counter()
+            test = AppTest.from_file(os.path.join(REPO_DIR, app), default_timeout=3600).run()
+            results.append(_app_result(f'app:{app}', started, test))
+            if app in DETAILED_APPS:
+                started = time.perf_counter()
+                test.sidebar.radio[0].set_value('Detailed Analysis').run()
+                results.append(_app_result(f'app:{app}:detailed', started, test))
+
+            # A rerun with warm caches, as every widget interaction triggers
+            started = time.perf_counter()
+            test.run()
+            results.append(_app_result(f'app:{app}:rerun', started, test))
+    finally:
+        os.chdir(previous_dir)
+    return results
+
+
+# Git revision of the working tree, marked dirty when it has local changes
+def git_revision():
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                                  text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f'{revision}-dirty' if dirty else revision
+
+
+# Append a run's results with the revision, size and environment they were measured on
+def save_results(results, rows, path=RESULTS_FILE):
+    run = {'revision': git_revision(), 'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+           'rows': rows, 'python': platform.python_version(), 'pandas': pd.__version__, 'host': platform.node()}
+    with open(path, 'a') as f:
+        for result in results:
+            f.write(json.dumps(dict(run, **result)) + '\n')
+
+
+# Stage timings of the latest run of each revision, one column per revision
+def load_results(path=RESULTS_FILE):
+    results = pd.read_json(path, lines=True)
+    latest = results.groupby('revision')['timestamp'].transform('max') == results['timestamp']
+    timings = results[latest].pivot_table(index=['rows', 'stage'], columns='revision', values='seconds', aggfunc='min')
+    order = results[latest].drop_duplicates('revision').sort_values('timestamp')['revision']
+    return timings[[revision for revision in order if revision in timings.columns]]
+
+
+# Stages at least REGRESSION_THRESHOLD times slower in the last revision than in the one before
+def regressions(timings, threshold=REGRESSION_THRESHOLD):
+    if timings.shape[1] < 2:
+        return timings.iloc[:0]
+    previous, latest = timings.columns[-2], timings.columns[-1]
+    ratio = timings[latest] / timings[previous]
+    return timings.assign(ratio=ratio)[ratio >= threshold]
+
+
+# Result of a stage the following stages need, stopping the benchmark with the stage's error if it failed
+def _required(results, value):
+    if value is None:
+        failed = results[-1]
+        raise RuntimeError(f"Benchmark stage {failed['stage']!r} failed, so the stages after it cannot run: {failed['error']}")
+    return value
+
+
+# Bar chart like the yearly registration charts of the dashboards
+def _bar_figure(counts):
+    import plotly.express as px
+    return px.bar(counts, x='year', y='count', color='maker')
+
+
+# Prophet fit and forecast of the monthly totals, like 03c.py
+def _fit(history):
+    from forecast_store import fit_forecast
+    return fit_forecast(history, {'freq': 'MS'})
+
+
+# Import 001.py without starting its server, then fire the graph callback
+# for every state/type pair, first cold and then from the figure cache
+def _benchmark_dash(path):
+    results = []
+    spec = importlib.util.spec_from_file_location('dash_app', path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules.pop('dash_app', None)
+    timed(results, 'app:001.py', spec.loader.exec_module, module)
+    if 'error' in results[-1]:
+        return results
+
+    pairs = [(state, vehicle_type) for state in module.states for vehicle_type in module.types]
+    for stage in ('app:001.py:callbacks', 'app:001.py:callbacks_cached'):
+        started = time.perf_counter()
+        for state, vehicle_type in pairs:
+            module.update_graph(state, vehicle_type)
+        results.append({'stage': stage, 'seconds': (time.perf_counter() - started) / max(len(pairs), 1)})
+    return results
+
+
+# Timing of a headless Streamlit run, with the first exception it raised
+def _app_result(stage, started, test):
+    result = {'stage': stage, 'seconds': time.perf_counter() - started}
+    if test.exception:
+        result['error'] = test.exception[0].message
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the dashboards on synthetic registration data")
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_SIZES, help="dataset sizes to benchmark")
+    parser.add_argument('--data-dir', default='.benchmark_data', help="directory for the generated datasets")
+    parser.add_argument('--apps', nargs='*', default=None,
+                        help="dashboards to run headlessly (default: all, pass none to skip)")
+    parser.add_argument('--no-forecast', action='store_true', help="skip the Prophet fit")
+    parser.add_argument('--out', default=RESULTS_FILE, help="results file to append to")
+    parser.add_argument('--compare', action='store_true', help="only compare the revisions already in the results file")
+    args = parser.parse_args()
+
+    if not args.compare:
+        for rows in args.rows:
+            data_dir = os.path.join(args.data_dir, str(rows))
+            parquet_path = os.path.join(data_dir, 'cars.parquet')
+            if not os.path.exists(parquet_path):
+                started = time.perf_counter()
+                generate_dataset(data_dir, rows)
+                print(f"Generated {rows:,} rows in {data_dir} in {time.perf_counter() - started:.1f}s")
+
+            results = benchmark_stages(parquet_path, forecast=not args.no_forecast)
+            if args.apps is None or args.apps:
+                results += benchmark_apps(data_dir, args.apps)
+            save_results(results, rows, args.out)
+            for result in results:
+                print(f"{rows:>12,} {result['stage']:<28} {result['seconds']:10.3f}s  {result.get('error', '')}")
+
+    timings = load_results(args.out)
+    print(timings.to_string(float_format=lambda seconds: f"{seconds:.3f}"))
+    slower = regressions(timings)
+    if len(slower):
+        print(f"\n{len(slower)} stages at least {REGRESSION_THRESHOLD:.1f}x slower than the previous revision:")
+        print(slower.to_string(float_format=lambda seconds: f"{seconds:.3f}"))
+    raise SystemExit(1 if len(slower) else 0)
@@ -0,0 +1,146 @@
+import argparse
+import itertools
+import os
+import shutil
+import tempfile
+import time
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from loader import CATEGORY_COLUMNS, CSV_CHUNK_ROWS, read_csv_chunks, scan_registrations
+
+# Typed schema of cars.parquet: parsed dates and dictionary-encoded labels
+REGISTRATION_SCHEMA = pa.schema([('date_reg', pa.timestamp('ns'))] +
+                                [(column, pa.dictionary(pa.int32(), pa.string())) for column in CATEGORY_COLUMNS])
+
+# Rows per row group; small enough to skip most of the file for a date range,
+# large enough to keep per-group overhead low
+ROW_GROUP_ROWS = 1_000_000
+
+# Compression codecs pyarrow can write
+CODECS = ['snappy', 'zstd', 'lz4', 'gzip', 'none']
+
+# Layouts compared by --benchmark: sort order, row group size and codec
+BENCHMARK_SORTS = [[], ['date_reg'], ['date_reg', 'state']]
+BENCHMARK_ROW_GROUPS = [128_000, 1_000_000, 8_000_000]
+BENCHMARK_CODECS = ['snappy', 'zstd', 'none']
+
+
+# Typed table of a CSV export or an existing Parquet file, read in chunks
+def read_registrations_table(source, chunksize=CSV_CHUNK_ROWS):
+    if source.endswith('.csv'):
+        chunks = read_csv_chunks(source, chunksize=chunksize)
+    else:
+        chunks = (batch.to_pandas() for batch in pq.ParquetFile(source).iter_batches(batch_size=chunksize))
+
+    tables = []
+    for chunk in chunks:
+        chunk['date_reg'] = pd.to_datetime(chunk['date_reg'], errors='coerce').astype('datetime64[ns]')
+        for column in CATEGORY_COLUMNS:
+            if not isinstance(chunk[column].dtype, pd.CategoricalDtype):
+                chunk[column] = chunk[column].astype('category')
+        tables.append(pa.Table.from_pandas(chunk[REGISTRATION_SCHEMA.names], schema=REGISTRATION_SCHEMA, preserve_index=False))
+
+    if not tables:
+        return REGISTRATION_SCHEMA.empty_table()
+
+    # One sorted dictionary per column, so every row group shares the same labels
+    # and they load as categoricals ordered like the rest of the pipeline's
+    table = pa.concat_tables(tables).unify_dictionaries().combine_chunks()
+    for column in CATEGORY_COLUMNS:
+        table = table.set_column(table.schema.get_field_index(column), column, _sorted_dictionary(table[column]))
+    return table
+
+
+# Write a registrations table sorted and split into row groups with min/max statistics
+def write_registrations(table, path, sort_by=('date_reg',), row_group_size=ROW_GROUP_ROWS, compression='snappy'):
+    if sort_by:
+        keys = pa.table({column: _sort_key(table[column]) for column in sort_by})
+        table = table.take(pc.sort_indices(keys, sort_keys=[(column, 'ascending') for column in sort_by]))
+
+    directory, name = os.path.split(os.path.abspath(path))
+    temporary_path = os.path.join(directory, f".{name}.tmp")
+    pq.write_table(table, temporary_path, row_group_size=row_group_size, compression=compression,
+                   use_dictionary=True, write_statistics=True)
+    os.replace(temporary_path, path)
+
+
+# Convert a CSV export (or re-layout a Parquet file) into the dashboards' Parquet layout
+def convert(source, path, sort_by=('date_reg',), row_group_size=ROW_GROUP_ROWS, compression='snappy'):
+    table = read_registrations_table(source)
+    write_registrations(table, path, sort_by, row_group_size, compression)
+    return table.num_rows
+
+
+# Time the dashboards' full load and a one-year scan of a Parquet file
+def read_throughput(path, repeats=3):
+    size = os.path.getsize(path)
+    result = {'size_mb': size / 1024 ** 2}
+    for name, kwargs in (('full', {}), ('year', {'start_date': '2024-01-01', 'end_date': '2024-12-31'})):
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            data, report = scan_registrations(path, **kwargs)
+            timings.append(time.perf_counter() - started)
+        seconds = min(timings)
+        result[f'{name}_seconds'] = seconds
+        result[f'{name}_rows_per_second'] = len(data) / seconds
+        result[f'{name}_mb_per_second'] = report['bytes_read'] / 1024 ** 2 / seconds
+        result[f'{name}_row_groups_read'] = f"{report['row_groups_read']}/{report['row_groups_total']}"
+    return result
+
+
+# Write every benchmark layout of a source to a temporary directory and compare their read throughput
+def benchmark_layouts(source, sorts=BENCHMARK_SORTS, row_groups=BENCHMARK_ROW_GROUPS, codecs=BENCHMARK_CODECS):
+    table = read_registrations_table(source)
+    results = []
+    directory = tempfile.mkdtemp(prefix='convert-benchmark-')
+    try:
+        for sort_by, row_group_size, compression in itertools.product(sorts, row_groups, codecs):
+            path = os.path.join(directory, 'cars.parquet')
+            write_registrations(table, path, sort_by, row_group_size, compression)
+            layout = {'sort_by': '+'.join(sort_by) or '(none)', 'row_group_size': row_group_size, 'compression': compression}
+            results.append(dict(layout, **read_throughput(path)))
+    finally:
+        shutil.rmtree(directory)
+    return pd.DataFrame(results).sort_values('full_seconds', ignore_index=True)
+
+
+# Dictionary column re-encoded with its labels in sorted order
+def _sorted_dictionary(column):
+    column = column.combine_chunks()
+    codes = pc.subtract(pc.rank(column.dictionary, sort_keys='ascending'), 1).cast(pa.int32())
+    return pa.DictionaryArray.from_arrays(pc.take(codes, column.indices), pc.take(column.dictionary, pc.sort_indices(column.dictionary)))
+
+
+# Values to sort a column by, missing values last; dictionary codes follow the sorted labels
+def _sort_key(column):
+    column = column.combine_chunks()
+    return column.indices if pa.types.is_dictionary(column.type) else column
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert a registrations CSV export into the dashboards' Parquet layout")
+    parser.add_argument('source', help="CSV export, or a Parquet file to re-layout")
+    parser.add_argument('out', nargs='?', default='cars.parquet', help="Parquet file to write")
+    parser.add_argument('--sort-by', nargs='*', default=['date_reg'], choices=['date_reg', 'state', 'type'],
+                        help="sort columns (default: date_reg)")
+    parser.add_argument('--row-group-size', type=int, default=ROW_GROUP_ROWS, help="rows per row group")
+    parser.add_argument('--compression', default='snappy', choices=CODECS, help="compression codec")
+    parser.add_argument('--benchmark', action='store_true', help="compare the read throughput of the candidate layouts")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        with pd.option_context('display.width', 200, 'display.max_columns', None):
+            print(benchmark_layouts(args.source).to_string(float_format=lambda value: f"{value:,.2f}"))
+    else:
+        started = time.perf_counter()
+        rows = convert(args.source, args.out, args.sort_by, args.row_group_size, args.compression)
+        metadata = pq.ParquetFile(args.out).metadata
+        print(f"Wrote {rows:,} rows in {metadata.num_row_groups} row groups "
+              f"({os.path.getsize(args.out) / 1024 ** 2:,.1f} MB, {args.compression}) to {args.out} "
+              f"in {time.perf_counter() - started:.1f}s")
+        throughput = read_throughput(args.out)
+        print(f"Full load {throughput['full_seconds']:.2f}s ({throughput['full_rows_per_second']:,.0f} rows/s), "
+              f"2024 scan {throughput['year_seconds']:.2f}s ({throughput['year_row_groups_read']} row groups)")
@@ -0,0 +1,95 @@
+import pandas as pd
+from loader import CSV_CHUNK_ROWS, load_registrations, parquet_source, read_csv_chunks
+from row_index import date_slice
+
+# Dimensions every dashboard view filters or groups on
+CUBE_DIMENSIONS = ['state', 'type', 'maker', 'fuel']
+
+# Supported time grains for the cube's date_reg column
+CUBE_FREQS = {'D': 'datetime64[D]', 'M': 'datetime64[M]'}
+
+
+# Build the registration count cube at (date_reg, state, type, maker, fuel)
+def build_cube(data, freq='D'):
+    if freq not in CUBE_FREQS:
+        raise ValueError(f"Unsupported cube frequency {freq!r}, expected one of {list(CUBE_FREQS)}")
+
+    # Truncate registration dates to the cube's time grain
+    dates = pd.to_datetime(data['date_reg'], errors='coerce')
+    truncated = dates.values.astype(CUBE_FREQS[freq]).astype('datetime64[ns]')
+
+    keys = data[CUBE_DIMENSIONS].copy()
+    keys.insert(0, 'date_reg', truncated)
+
+    # Keep rows with missing values so totals match the raw row count
+    cube = keys.groupby(['date_reg'] + CUBE_DIMENSIONS, observed=True, dropna=False).size().reset_index(name='count')
+    cube.insert(1, 'year', cube['date_reg'].dt.year.astype('Int16'))
+    return cube
+
+
+# Select the cube cells matching a date range and state/type/year filters
+def slice_cube(cube, start_date=None, end_date=None, state=None, vehicle_type=None, year=None):
+    # Cells are ordered by date_reg, so the date range is a binary search
+    if start_date is not None or end_date is not None:
+        cube = date_slice(cube, start_date, end_date)
+
+    mask = pd.Series(True, index=cube.index)
+    if state is not None:
+        mask &= cube['state'] == state
+    if vehicle_type is not None:
+        mask &= cube['type'] == vehicle_type
+    if year is not None:
+        mask &= cube['year'] == year
+    return cube[mask]
+
+
+# Build the cube from a CSV export one chunk at a time, so peak memory
+# depends on the chunk size and the number of cube cells, not the file size
+def stream_cube(path, freq='D', chunksize=CSV_CHUNK_ROWS):
+    cube = None
+    for chunk in read_csv_chunks(path, columns=['date_reg'] + CUBE_DIMENSIONS, chunksize=chunksize):
+        delta = build_cube(chunk, freq=freq)
+        cube = delta if cube is None else merge_cubes([cube, delta])
+    return cube
+
+
+# Add cubes together, e.g. the stored cube and the cube of a new batch
+def merge_cubes(cubes):
+    merged = pd.concat(cubes, ignore_index=True)
+
+    # Cubes with different categories concatenate to objects; keep the dimensions categorical
+    for column in CUBE_DIMENSIONS:
+        if not isinstance(merged[column].dtype, pd.CategoricalDtype):
+            merged[column] = merged[column].astype('category')
+
+    keys = ['date_reg', 'year'] + CUBE_DIMENSIONS
+    return merged.groupby(keys, observed=True, dropna=False)['count'].sum().reset_index()
+
+
+# Registration counts grouped by one or more cube columns, like groupby(...).size()
+def count_by(cube, by):
+    return cube.groupby(by, observed=True)['count'].sum()
+
+
+# Registration counts per value of a column, like value_counts()
+def value_counts(cube, column):
+    counts = count_by(cube, column)
+    return counts[counts > 0].sort_values(ascending=False)
+
+
+# Total registrations, optionally restricted to one fuel type
+def total(cube, fuel=None):
+    if fuel is not None:
+        cube = cube[cube['fuel'] == fuel]
+    return int(cube['count'].sum())
+
+
+# Yearly registrations per maker, as stored in grouped_yearly_data.csv
+def yearly_maker_counts(cube):
+    return count_by(cube, ['year', 'maker']).reset_index(name='count')
+
+
+if __name__ == '__main__':
+    # Regenerate grouped_yearly_data.csv from the raw data
+    cube = build_cube(load_registrations(parquet_source(), columns=['date_reg'] + CUBE_DIMENSIONS), freq='M')
+    yearly_maker_counts(cube).to_csv('grouped_yearly_data.csv', index=False)
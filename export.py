@@ -0,0 +1,153 @@
+import argparse
+import os
+import shlex
+import tempfile
+from functools import lru_cache
+import pandas as pd
+import pyarrow.csv as pacsv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from loader import data_version
+from parquet_scan import scan_filter
+
+# Rows read from the source and written to the export at a time
+EXPORT_BATCH_ROWS = int(os.environ.get('EXPORT_BATCH_ROWS', '65536'))
+
+# Rows a download button exports at most. Streamlit holds a download in memory,
+# so bigger selections are pointed at the command line, which writes to disk.
+EXPORT_MAX_ROWS = int(os.environ.get('EXPORT_MAX_ROWS', '1000000'))
+
+# Directory exports are written to before they are downloaded, the system temp directory when unset
+EXPORT_DIR = os.environ.get('EXPORT_DIR') or None
+
+# File extension and MIME type of each export format
+EXPORT_FORMATS = {'csv': ('csv', 'text/csv'), 'parquet': ('parquet', 'application/vnd.apache.parquet')}
+
+
+# Scanner over the rows of cars_2024.csv, cars.parquet or the partitioned
+# dataset in a date range and state/type selection. The filter is pushed down
+# to the reader, so Parquet row groups and year directories outside it are
+# skipped, and rows come out in file order one batch at a time.
+def export_scanner(source, start_date=None, end_date=None, states=None, types=None, columns=None,
+                   batch_size=EXPORT_BATCH_ROWS):
+    if source.endswith('.csv'):
+        dataset = ds.dataset(source, format='csv')
+    else:
+        dataset = ds.dataset(source, format='parquet', partitioning='hive')
+    expression = scan_filter(dataset.schema, start_date, end_date, states, types)
+    if columns is not None:
+        columns = [column for column in columns if column in dataset.schema.names]
+    return dataset.scanner(columns=columns, filter=expression, batch_size=batch_size)
+
+
+# Write a scanner's batches to a CSV or Parquet file as they are read, so only
+# one batch is in memory at a time, and return the number of rows written
+def write_export(scanner, path, export_format='csv'):
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format {export_format!r}, expected one of {list(EXPORT_FORMATS)}")
+
+    schema = scanner.projected_schema
+    writer = pacsv.CSVWriter(path, schema) if export_format == 'csv' else pq.ParquetWriter(path, schema)
+    rows = 0
+    try:
+        for batch in scanner.to_batches():
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    finally:
+        writer.close()
+    return rows
+
+
+# Export a selection to a new temporary file, returning its path and row count; the caller removes it
+def spool_export(source, export_format='csv', start_date=None, end_date=None, states=None, types=None,
+                 export_dir=EXPORT_DIR):
+    extension, _ = EXPORT_FORMATS[export_format]
+    handle, path = tempfile.mkstemp(prefix='registrations_', suffix=f'.{extension}', dir=export_dir)
+    os.close(handle)
+    try:
+        rows = write_export(export_scanner(source, start_date, end_date, states, types), path, export_format)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, rows
+
+
+# Rows of a selection, counted by the scanner without reading any column
+# values the filter does not need. Row groups and directories outside the
+# filter are skipped, and Parquet counts come from the file metadata.
+def export_rows(source, start_date=None, end_date=None, states=None, types=None):
+    return _export_rows(source, data_version(source), start_date, end_date,
+                        None if states is None else tuple(states), None if types is None else tuple(types))
+
+
+# Command line exporting a selection to disk with this script
+def export_command(out, source, start_date=None, end_date=None, states=None, types=None):
+    command = ['python', 'export.py', out, '--source', source]
+    command += [argument for flag, value in (('--start', start_date), ('--end', end_date)) if value is not None
+                for argument in (flag, f"{pd.Timestamp(value):%Y-%m-%d}")]
+    command += [argument for flag, values in (('--state', states), ('--type', types)) for value in values or []
+                for argument in (flag, str(value))]
+    return shlex.join(command)
+
+
+# File name of an export of a date range
+def export_file_name(export_format, start_date=None, end_date=None):
+    dates = [f"{pd.Timestamp(value):%Y%m%d}" for value in (start_date, end_date) if value is not None]
+    return '_'.join(['registrations'] + dates) + f".{EXPORT_FORMATS[export_format][0]}"
+
+
+# Format picker and download button exporting a selection straight from the
+# source file. The export only runs when the button is clicked, never on reruns.
+# Selections over EXPORT_MAX_ROWS get the command exporting them to disk instead.
+def export_button(source, key, start_date=None, end_date=None, states=None, types=None):
+    import streamlit as st
+
+    format_col, button_col = st.columns([1, 3], vertical_alignment='bottom')
+    export_format = format_col.selectbox("Export format", list(EXPORT_FORMATS), format_func=str.upper,
+                                         key=f"{key}_export_format")
+
+    file_name = export_file_name(export_format, start_date, end_date)
+    rows = export_rows(source, start_date, end_date, states, types)
+    if rows > EXPORT_MAX_ROWS:
+        command = export_command(file_name, source, start_date, end_date, states, types)
+        button_col.info(f"{rows:,} rows is over the {EXPORT_MAX_ROWS:,} row download limit, "
+                        f"export them to disk with `{command}`")
+        return
+
+    def download():
+        path, _ = spool_export(source, export_format, start_date, end_date, states, types)
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        finally:
+            os.remove(path)
+
+    button_col.download_button(f"Download {export_format.upper()}", data=download,
+                               file_name=file_name,
+                               mime=EXPORT_FORMATS[export_format][1], key=f"{key}_export", on_click='ignore')
+
+
+# Row count of a selection at one data version, memoized since every rerun asks again
+@lru_cache(maxsize=64)
+def _export_rows(source, version, start_date, end_date, states, types):
+    states = None if states is None else list(states)
+    types = None if types is None else list(types)
+    return export_scanner(source, start_date, end_date, states, types, columns=[]).count_rows()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export registrations in a date range and state/type selection, one batch at a time")
+    parser.add_argument('out', help="file to write, .csv or .parquet")
+    parser.add_argument('--source', default=None, help="cars_2024.csv, cars.parquet or the partitioned dataset (default: the Parquet source)")
+    parser.add_argument('--start', default=None, help="first registration date, YYYY-MM-DD")
+    parser.add_argument('--end', default=None, help="last registration date, YYYY-MM-DD")
+    parser.add_argument('--state', action='append', default=None, help="state to keep, repeatable")
+    parser.add_argument('--type', action='append', default=None, help="vehicle type to keep, repeatable")
+    args = parser.parse_args()
+
+    if args.source is None:
+        from loader import parquet_source
+        args.source = parquet_source()
+    export_format = 'parquet' if args.out.endswith('.parquet') else 'csv'
+    rows = write_export(export_scanner(args.source, args.start, args.end, args.state, args.type), args.out, export_format)
+    print(f"Wrote {rows:,} rows to {args.out}")
@@ -0,0 +1,57 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+import plotly.graph_objects as go
+
+# Figures kept per process; the least recently shown is dropped first
+FIGURE_CACHE_SIZE = int(os.environ.get('FIGURE_CACHE_SIZE', '128'))
+
+# Serialized figures by (chart, view parameters, data fingerprint), oldest first
+_figures = OrderedDict()
+_fingerprints = {}
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+# Figure of a chart for one set of view parameters. build() does the chart's
+# aggregation and returns the figure; it only runs when this view has not been
+# shown since the data fingerprint last changed. Every call gets its own copy.
+def cached_figure(chart, params, fingerprint, build, size=None):
+    size = FIGURE_CACHE_SIZE if size is None else size
+    key = (chart, params, fingerprint)
+    with _lock:
+        figure_json = _figures.get(key)
+        if figure_json is not None:
+            _figures.move_to_end(key)
+            _stats['hits'] += 1
+
+    if figure_json is None:
+        figure_json = build().to_json()
+        with _lock:
+            _stats['misses'] += 1
+            # Figures of older data are never shown again
+            if _fingerprints.get(chart, fingerprint) != fingerprint:
+                for stale in [stale for stale in _figures if stale[0] == chart]:
+                    del _figures[stale]
+            _fingerprints[chart] = fingerprint
+            _figures[key] = figure_json
+            while len(_figures) > size:
+                _figures.popitem(last=False)
+                _stats['evictions'] += 1
+
+    # The JSON came from a validated figure, and validating it again costs more than building most charts
+    return go.Figure(json.loads(figure_json), _validate=False)
+
+
+# Hit/miss counts and size of this process's figure cache
+def figure_stats():
+    with _lock:
+        return dict(_stats, figures=len(_figures), bytes=sum(len(figure_json) for figure_json in _figures.values()))
+
+
+# Drop every cached figure
+def clear_figures():
+    with _lock:
+        _figures.clear()
+        _fingerprints.clear()
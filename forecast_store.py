@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:  # Windows has no fcntl; stats updates are then best-effort
+    fcntl = None
+import pandas as pd
+
+# Directory holding fitted models and their forecasts between runs
+STORE_DIR = os.environ.get('FORECAST_STORE', '.forecast_store')
+
+# Forecast horizon used by the dashboard when no parameters are given, in month starts like the series
+DEFAULT_PARAMS = {'periods': 24, 'freq': 'MS'}
+
+# Models already loaded by this process, keyed by fingerprint
+_loaded = {}
+
+
+# Fingerprint of the input series and the model parameters
+def forecast_key(history, params):
+    digest = hashlib.sha256()
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+    digest.update(pd.util.hash_pandas_object(history[['ds', 'y']], index=False).values.tobytes())
+    return digest.hexdigest()[:32]
+
+
+# Fit Prophet on a ds/y series and forecast the requested horizon.
+# Prophet and cmdstanpy take most of a second to import, so they load on the first fit.
+def fit_forecast(history, params=None):
+    from prophet import Prophet
+    params = dict(DEFAULT_PARAMS, **(params or {}))
+    model_params = {name: value for name, value in params.items() if name not in ('periods', 'freq')}
+
+    model = Prophet(**model_params)
+    model.fit(history[['ds', 'y']])
+
+    future = model.make_future_dataframe(periods=params['periods'], freq=params['freq'])
+    forecast = model.predict(future)
+    return model, forecast
+
+
+# Fitted model and forecast for a series, fitting only on a store miss
+def cached_forecast(history, params=None, store_dir=STORE_DIR):
+    params = dict(DEFAULT_PARAMS, **(params or {}))
+    key = forecast_key(history, params)
+
+    if key in _loaded:
+        _record(store_dir, hit=True, fit_seconds=_loaded[key][2])
+        return _loaded[key][:2]
+
+    entry_dir = os.path.join(store_dir, key)
+    if os.path.isdir(entry_dir):
+        from prophet.serialize import model_from_json
+        with open(os.path.join(entry_dir, 'model.json')) as f:
+            model = model_from_json(f.read())
+        forecast = pd.read_parquet(os.path.join(entry_dir, 'forecast.parquet'))
+        with open(os.path.join(entry_dir, 'meta.json')) as f:
+            fit_seconds = json.load(f)['fit_seconds']
+        _loaded[key] = (model, forecast, fit_seconds)
+        _record(store_dir, hit=True, fit_seconds=fit_seconds)
+        return model, forecast
+
+    started = time.perf_counter()
+    model, forecast = fit_forecast(history, params)
+    fit_seconds = time.perf_counter() - started
+
+    _save(store_dir, key, model, forecast, {'params': params, 'rows': len(history), 'fit_seconds': fit_seconds})
+    _loaded[key] = (model, forecast, fit_seconds)
+    _record(store_dir, hit=False, fit_seconds=fit_seconds)
+    return model, forecast
+
+
+# Cache hit/miss counts and fit time spent or saved so far
+def store_stats(store_dir=STORE_DIR):
+    try:
+        with open(os.path.join(store_dir, 'stats.json')) as f:
+            stats = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        stats = {'hits': 0, 'misses': 0, 'fit_seconds': 0.0, 'saved_seconds': 0.0}
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+    return stats
+
+
+# Write an entry to a temporary directory and move it into place atomically
+def _save(store_dir, key, model, forecast, meta):
+    from prophet.serialize import model_to_json
+    os.makedirs(store_dir, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(dir=store_dir, prefix='.tmp-')
+    with open(os.path.join(staging_dir, 'model.json'), 'w') as f:
+        f.write(model_to_json(model))
+    forecast.to_parquet(os.path.join(staging_dir, 'forecast.parquet'), index=False)
+    with open(os.path.join(staging_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f, default=str)
+    try:
+        os.rename(staging_dir, os.path.join(store_dir, key))
+    except OSError:
+        # Another session stored the same entry first
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+# Add one lookup to the persisted statistics
+def _record(store_dir, hit, fit_seconds):
+    os.makedirs(store_dir, exist_ok=True)
+    with _stats_lock(store_dir):
+        stats = store_stats(store_dir)
+        stats.pop('hit_rate')
+        if hit:
+            stats['hits'] += 1
+            stats['saved_seconds'] += fit_seconds
+        else:
+            stats['misses'] += 1
+            stats['fit_seconds'] += fit_seconds
+
+        stats_path = os.path.join(store_dir, 'stats.json')
+        with tempfile.NamedTemporaryFile('w', dir=store_dir, delete=False, suffix='.json') as f:
+            json.dump(stats, f)
+        os.replace(f.name, stats_path)
+
+
+# Serialise stats updates from concurrent sessions and worker processes
+@contextmanager
+def _stats_lock(store_dir):
+    with open(os.path.join(store_dir, 'stats.lock'), 'w') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,115 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+import pandas as pd
+from loader import DATASET_DIR, MANIFEST_FILE, load_registrations
+from cube import build_cube, merge_cubes, yearly_maker_counts
+
+# Aggregates kept up to date next to the partitioned dataset
+AGGREGATES_DIR = '_aggregates'
+MONTHLY_CUBE_FILE = 'cube_monthly.parquet'
+YEARLY_MAKER_FILE = 'grouped_yearly_data.csv'
+
+
+# Content hash of a batch file, so the same batch is never ingested twice
+def batch_id(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+# Ingested batches and dataset version, as recorded in the manifest
+def read_manifest(dataset_dir=DATASET_DIR):
+    try:
+        with open(os.path.join(dataset_dir, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'version': 0, 'rows': 0, 'batches': {}}
+
+
+# Monthly cube maintained by ingest(), or None if the path is not an ingested dataset
+def load_monthly_cube(dataset_dir=DATASET_DIR):
+    path = os.path.join(dataset_dir, AGGREGATES_DIR, MONTHLY_CUBE_FILE)
+    if not os.path.exists(path):
+        return None
+    return pd.read_parquet(path)
+
+
+# Append one batch of registrations and fold it into the stored aggregates
+def ingest(batch_path, dataset_dir=DATASET_DIR, yearly_csv=YEARLY_MAKER_FILE):
+    manifest = read_manifest(dataset_dir)
+    batch = batch_id(batch_path)
+    if batch in manifest['batches']:
+        return None
+
+    data = load_registrations(batch_path)
+
+    # Write one file per year/month partition touched by the batch
+    partitions = []
+    columns = [column for column in data.columns if column not in ('year', 'month')]
+    for (year, month), rows in data.groupby(['year', 'month'], dropna=False):
+        partition = f"year={_partition_value(year)}/month={_partition_value(month)}"
+        os.makedirs(os.path.join(dataset_dir, partition), exist_ok=True)
+        rows = rows[columns].astype({column: str for column in columns if isinstance(rows[column].dtype, pd.CategoricalDtype)})
+        _replace(rows.to_parquet, os.path.join(dataset_dir, partition, f"part-{batch}.parquet"), index=False)
+        partitions.append(partition)
+
+    # Fold the batch's counts into the stored monthly cube
+    delta = build_cube(data, freq='M')
+    aggregates_dir = os.path.join(dataset_dir, AGGREGATES_DIR)
+    os.makedirs(aggregates_dir, exist_ok=True)
+    stored = load_monthly_cube(dataset_dir)
+    cube = delta if stored is None else merge_cubes([stored, delta])
+    _replace(cube.to_parquet, os.path.join(aggregates_dir, MONTHLY_CUBE_FILE), index=False)
+
+    # Fold the batch's yearly maker counts into grouped_yearly_data.csv,
+    # starting it afresh on the first batch of a new dataset
+    yearly = yearly_maker_counts(delta)
+    if stored is not None and os.path.exists(yearly_csv):
+        yearly = pd.concat([pd.read_csv(yearly_csv), yearly], ignore_index=True)
+        yearly = yearly.groupby(['year', 'maker'], observed=True)['count'].sum().reset_index()
+    _replace(yearly.to_csv, yearly_csv, index=False)
+
+    manifest['version'] += 1
+    manifest['rows'] += len(data)
+    manifest['batches'][batch] = {'source': os.path.abspath(batch_path), 'rows': len(data),
+                                  'partitions': partitions, 'ingested_at': time.time()}
+    manifest_path = os.path.join(dataset_dir, MANIFEST_FILE)
+    with open(f"{manifest_path}.tmp", 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+    return manifest['batches'][batch]
+
+
+# Partition directory value, with missing dates in Hive's null partition
+def _partition_value(value):
+    return '__HIVE_DEFAULT_PARTITION__' if pd.isna(value) else int(value)
+
+
+# Write through a hidden temporary file so readers never see a partial file
+def _replace(write, path, **kwargs):
+    directory, name = os.path.split(path)
+    temporary_path = os.path.join(directory, f".{name}.tmp")
+    write(temporary_path, **kwargs)
+    os.replace(temporary_path, path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Append registration batches to the partitioned dataset")
+    parser.add_argument('batches', nargs='+', help="CSV or Parquet files with new registrations")
+    parser.add_argument('--dataset', default=DATASET_DIR, help="partitioned dataset directory")
+    parser.add_argument('--yearly-csv', default=YEARLY_MAKER_FILE, help="yearly maker counts to keep up to date")
+    args = parser.parse_args()
+
+    for path in args.batches:
+        started = time.perf_counter()
+        result = ingest(path, args.dataset, args.yearly_csv)
+        if result is None:
+            print(f"{path}: already ingested, skipped")
+        else:
+            print(f"{path}: {result['rows']:,} rows into {len(result['partitions'])} partitions "
+                  f"in {time.perf_counter() - started:.1f}s")
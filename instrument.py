@@ -0,0 +1,180 @@
+import atexit
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Prometheus text files rewritten with the stage totals, empty to disable. Every
+# app and process writes its own, e.g. dashboard_metrics.03a.12345.prom, so
+# several apps or gunicorn workers sharing a textfile collector directory all show up.
+METRICS_FILE = os.environ.get('DASHBOARD_METRICS_FILE', 'dashboard_metrics.prom')
+
+# Seconds between rewrites of the metrics file
+METRICS_INTERVAL = float(os.environ.get('DASHBOARD_METRICS_INTERVAL', '10'))
+
+# Show the debug panel on every page, not only with ?debug=1 in the URL
+DEBUG_PANEL = os.environ.get('DASHBOARD_DEBUG', '') not in ('', '0')
+
+# Bytes per memory page, for reading /proc/self/statm
+PAGE_BYTES = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+# Stages of the run in progress, per thread since every Streamlit session reruns in its own
+_run = threading.local()
+
+# Totals per app and stage since this process started
+_totals = {}
+_totals_lock = threading.Lock()
+
+# When each app's metrics file was last written, and the files this process wrote
+_last_written = {}
+_written_paths = set()
+
+
+# Start recording the stages of one rerun or callback of an app
+def start_run(app):
+    _run.app = app
+    _run.stages = []
+
+
+# Record wall time, rows and resident memory change of one stage.
+# The caller sets record['rows_out'] once the stage has produced its rows.
+@contextmanager
+def stage(name, rows_in=None):
+    record = {'stage': name, 'rows_in': rows_in, 'rows_out': None}
+    memory_before = _resident_bytes()
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['seconds'] = time.perf_counter() - started
+        record['memory_delta'] = _resident_bytes() - memory_before
+        _record(getattr(_run, 'app', 'unknown'), record)
+
+
+# Stages recorded so far in this thread's run
+def run_stages():
+    return list(getattr(_run, 'stages', []))
+
+
+# Finish the run, rewriting the metrics file when it is due
+def finish_run(path=METRICS_FILE, interval=METRICS_INTERVAL):
+    app = getattr(_run, 'app', 'unknown')
+    now = time.monotonic()
+    if path and now - _last_written.get(app, float('-inf')) >= interval:
+        _last_written[app] = now
+        write_metrics(metrics_path(app, path), app)
+    return run_stages()
+
+
+# Metrics file of one app in this process, e.g. dashboard_metrics.03c_warmup.12345.prom for '03c.py:warmup'
+def metrics_path(app, path=METRICS_FILE):
+    root, extension = os.path.splitext(path)
+    name = re.sub(r'[^A-Za-z0-9_-]+', '_', app.replace('.py', ''))
+    return f"{root}.{name}.{os.getpid()}{extension}"
+
+
+# Stage totals in the Prometheus text exposition format, of one app or all of them
+def prometheus_text(app=None):
+    with _totals_lock:
+        totals = {key: dict(values) for key, values in _totals.items() if app is None or key[0] == app}
+
+    metrics = [
+        ('dashboard_stage_calls_total', 'counter', 'Times each dashboard stage ran', 'calls'),
+        ('dashboard_stage_seconds_total', 'counter', 'Wall time spent in each dashboard stage', 'seconds'),
+        ('dashboard_stage_rows_in_total', 'counter', 'Rows each dashboard stage was given', 'rows_in'),
+        ('dashboard_stage_rows_out_total', 'counter', 'Rows each dashboard stage produced', 'rows_out'),
+        ('dashboard_stage_last_seconds', 'gauge', 'Wall time of the latest run of each dashboard stage', 'last_seconds'),
+        ('dashboard_stage_last_memory_delta_bytes', 'gauge',
+         'Resident memory change during the latest run of each dashboard stage', 'last_memory_delta'),
+    ]
+    lines = []
+    for metric, kind, description, field in metrics:
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for (app, name), values in sorted(totals.items()):
+            lines.append(f'{metric}{{app="{_label(app)}",stage="{_label(name)}",pid="{os.getpid()}"}} {values[field]:g}')
+    return '\n'.join(lines) + '\n'
+
+
+# Write the stage totals for a node exporter textfile collector or any scraper.
+# The file is removed when the process exits, so stopped workers leave no stale metrics.
+def write_metrics(path, app=None):
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, 'w') as f:
+        f.write(prometheus_text(app))
+    os.replace(temporary_path, path)
+    if path not in _written_paths:
+        _written_paths.add(path)
+        if len(_written_paths) == 1:
+            atexit.register(_remove_metrics)
+
+
+# Serve the stage totals at /metrics from a Dash app's Flask server
+def serve_metrics(server, route='/metrics'):
+    from flask import Response
+    server.add_url_rule(route, 'metrics', lambda: Response(prometheus_text(), mimetype='text/plain; version=0.0.4'))
+
+
+# Sidebar expander listing the stages of this rerun, shown with DASHBOARD_DEBUG=1 or ?debug=1
+def debug_panel():
+    import streamlit as st
+    if not (DEBUG_PANEL or st.query_params.get('debug') == '1'):
+        return
+
+    stages = run_stages()
+    with st.sidebar.expander("Debug: stage timings", expanded=True):
+        st.dataframe([{'stage': record['stage'],
+                       'ms': round(record['seconds'] * 1000, 1),
+                       'rows in': record['rows_in'],
+                       'rows out': record['rows_out'],
+                       'memory MB': round(record['memory_delta'] / 1024 ** 2, 1)} for record in stages],
+                     hide_index=True)
+        st.caption(f"{sum(record['seconds'] for record in stages) * 1000:,.1f} ms in {len(stages)} stages, "
+                   f"worker {os.getpid()}")
+
+
+# Add a finished stage to this run and to the process totals
+def _record(app, record):
+    if hasattr(_run, 'stages'):
+        _run.stages.append(record)
+    with _totals_lock:
+        totals = _totals.setdefault((app, record['stage']), {'calls': 0, 'seconds': 0.0, 'rows_in': 0, 'rows_out': 0})
+        totals['calls'] += 1
+        totals['seconds'] += record['seconds']
+        totals['rows_in'] += record['rows_in'] or 0
+        totals['rows_out'] += record['rows_out'] or 0
+        totals['last_seconds'] = record['seconds']
+        totals['last_memory_delta'] = record['memory_delta']
+
+
+# Remove the metrics files this process wrote
+def _remove_metrics():
+    for path in _written_paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# Current resident set size, cheap enough to read around every stage
+def _resident_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_BYTES
+    except OSError:
+        # No /proc (macOS, Windows): fall back to the peak resident size
+        if resource is None:
+            return 0
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+# Escape a Prometheus label value
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+from row_index import date_slice
+
+# Registered KPIs: name -> (cube column whose counts it needs, function of those counts).
+# KPIs without a column get the total registration count.
+KPIS = {}
+
+
+# Register a KPI computed from the registration counts per label of a cube column
+def kpi(name, column=None):
+    def register(function):
+        KPIS[name] = (column, function)
+        return function
+    return register
+
+
+@kpi('total')
+def _total(total):
+    return total
+
+
+@kpi('petrol', 'fuel')
+def _petrol(counts):
+    return int(counts.get('petrol', 0))
+
+
+@kpi('diesel', 'fuel')
+def _diesel(counts):
+    return int(counts.get('diesel', 0))
+
+
+@kpi('fuel', 'fuel')
+def _fuel(counts):
+    return _ranked(counts)
+
+
+@kpi('type', 'type')
+def _type(counts):
+    return _ranked(counts)
+
+
+@kpi('maker', 'maker')
+def _maker(counts):
+    return _ranked(counts)
+
+
+@kpi('distinct_makers', 'maker')
+def _distinct_makers(counts):
+    return int((counts > 0).sum())
+
+
+# Every registered KPI of a cube in one pass: one weighted bincount of the
+# category codes per column the KPIs need, instead of a boolean mask per KPI.
+# Cells with a zero weight are left out without copying the cube.
+def compute_kpis(cube, weights=None, names=None):
+    names = list(KPIS) if names is None else names
+    weights = cube['count'].to_numpy() if weights is None else weights
+
+    counts = {None: int(weights.sum())}
+    for column in {KPIS[name][0] for name in names} - {None}:
+        codes, labels = _codes(cube[column])
+        valid = codes >= 0
+        totals = np.bincount(codes[valid], weights=weights[valid], minlength=len(labels))
+        counts[column] = pd.Series(totals.astype(np.int64), index=labels.rename(column), name='count')
+    return {name: KPIS[name][1](counts[KPIS[name][0]]) for name in names}
+
+
+# KPIs of the cube cells matching a date range and state/type/year filters
+def selection_kpis(cube, start_date=None, end_date=None, state=None, vehicle_type=None, year=None, names=None):
+    # Cells are ordered by date_reg, so the date range and year are binary searches
+    if start_date is not None or end_date is not None:
+        cube = date_slice(cube, start_date, end_date)
+    if year is not None:
+        cube = date_slice(cube, pd.Timestamp(year=year, month=1, day=1), pd.Timestamp(year=year, month=12, day=31))
+
+    weights = cube['count'].to_numpy()
+    for column, value in (('state', state), ('type', vehicle_type)):
+        if value is not None:
+            weights = np.where((cube[column] == value).to_numpy(dtype=bool, na_value=False), weights, 0)
+    return compute_kpis(cube, weights, names)
+
+
+# Category codes and labels of a column, factorizing plain string columns
+def _codes(values):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), values.cat.categories
+    codes, labels = pd.factorize(values)
+    return codes, pd.Index(labels)
+
+
+# Counts per label like value_counts(): largest first, labels without registrations dropped
+def _ranked(counts):
+    return counts[counts > 0].sort_values(ascending=False)
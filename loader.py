@@ -0,0 +1,99 @@
+import os
+import pandas as pd
+from parquet_scan import scan_parquet
+from row_index import date_slice
+
+# Year/month partitioned dataset maintained by ingest.py
+DATASET_DIR = 'cars_dataset'
+
+# File ingest.py rewrites after every batch, used to version the dataset
+MANIFEST_FILE = '_manifest.json'
+
+# Low-cardinality string columns stored as pandas categoricals
+CATEGORY_COLUMNS = ['state', 'type', 'maker', 'model', 'colour', 'fuel']
+
+# Explicit CSV dtypes, so pandas never infers types or holds string columns as objects
+CSV_DTYPES = dict({'date_reg': 'str'}, **{column: 'category' for column in CATEGORY_COLUMNS})
+
+# Rows read per chunk when streaming a CSV export
+CSV_CHUNK_ROWS = int(os.environ.get('CSV_CHUNK_ROWS', '500000'))
+
+# CSV exports larger than this many MB are only streamed into aggregates, never loaded whole
+CSV_STREAM_THRESHOLD_MB = float(os.environ.get('CSV_STREAM_THRESHOLD_MB', '256'))
+
+
+# Partitioned dataset when it has been ingested, otherwise cars.parquet
+def parquet_source(default='cars.parquet'):
+    return DATASET_DIR if os.path.isdir(DATASET_DIR) else default
+
+
+# Changes whenever the data behind a path changes, for use as a cache key
+def data_version(path):
+    manifest = os.path.join(path, MANIFEST_FILE)
+    return os.path.getmtime(manifest if os.path.exists(manifest) else path)
+
+
+# Load cars.parquet, cars_2024.csv or the partitioned dataset into a typed, compact frame
+def load_registrations(path, columns=None, start_date=None, end_date=None, states=None, types=None):
+    return scan_registrations(path, columns, start_date, end_date, states, types)[0]
+
+
+# Load registrations along with a report of how much of the file was read.
+# Parquet reads push the column selection and filters down to the reader.
+def scan_registrations(path, columns=None, start_date=None, end_date=None, states=None, types=None):
+    if path.endswith('.csv'):
+        data = pd.read_csv(path, usecols=columns, dtype=CSV_DTYPES)
+        report = {'bytes_read': os.path.getsize(path), 'bytes_total': os.path.getsize(path),
+                  'row_groups_read': 1, 'row_groups_total': 1, 'rows': len(data)}
+        data = prepare_registrations(data)
+        data = date_slice(data, start_date, end_date) if start_date is not None or end_date is not None else data
+        if states is not None:
+            data = data[data['state'].isin(states)]
+        if types is not None:
+            data = data[data['type'].isin(types)]
+        return data, report
+
+    table, report = scan_parquet(path, columns, start_date, end_date, states, types)
+    return prepare_registrations(table.to_pandas()), report
+
+
+# Typed chunks of a CSV export, with at most chunksize rows in memory at a time
+def read_csv_chunks(path, columns=None, chunksize=CSV_CHUNK_ROWS):
+    with pd.read_csv(path, usecols=columns, dtype=CSV_DTYPES, chunksize=chunksize) as reader:
+        yield from reader
+
+
+# Whether a CSV export is too large to load whole and should only be streamed
+def stream_only(path, threshold_mb=CSV_STREAM_THRESHOLD_MB):
+    return os.path.getsize(path) > threshold_mb * 1024 ** 2
+
+
+# Parse dates, derive year/month and shrink dtypes, all in one place
+def prepare_registrations(data):
+    data['date_reg'] = pd.to_datetime(data['date_reg'], errors='coerce')
+    data['year'] = data['date_reg'].dt.year.astype('Int16')
+    data['month'] = data['date_reg'].dt.month.astype('Int8')
+
+    for column in CATEGORY_COLUMNS:
+        if column in data.columns and not isinstance(data[column].dtype, pd.CategoricalDtype):
+            data[column] = data[column].astype('category')
+
+    # Downcast any remaining plain integer columns
+    for column in data.select_dtypes(include='integer').columns:
+        data[column] = pd.to_numeric(data[column], downcast='integer')
+
+    # Keep rows in registration order so any date range is a contiguous slice
+    if not data['date_reg'].is_monotonic_increasing:
+        data = data.sort_values('date_reg', kind='stable', na_position='last', ignore_index=True)
+
+    return data
+
+
+# Memory used by a frame in bytes, including category labels
+def memory_footprint(data):
+    return int(data.memory_usage(deep=True).sum())
+
+
+# Human readable memory footprint for the dashboard sidebars
+def format_footprint(data):
+    return f"{memory_footprint(data) / 1024 ** 2:,.1f} MB in memory ({len(data):,} rows)"
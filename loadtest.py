@@ -0,0 +1,163 @@
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import numpy as np
+
+# Directory the repository's scripts live in
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Worker counts compared when none are given
+WORKER_COUNTS = [1, 2, 4]
+
+# Concurrent clients and seconds each worker count is loaded for
+CLIENTS = int(os.environ.get('LOADTEST_CLIENTS', '8'))
+DURATION = float(os.environ.get('LOADTEST_DURATION', '20'))
+
+# Seconds to wait for the workers to load the data and answer
+STARTUP_TIMEOUT = 300.0
+
+
+# Start serve_dash.py with a number of workers on a free port and its shared
+# cache in cache_dir, and wait until every worker has loaded the app
+def start_server(workers, cache_dir, data_dir='.', warmup=False):
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    env = dict(os.environ, DASH_CACHE_DIR=cache_dir, DASHBOARD_WARMUP='1' if warmup else '0')
+    process = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, 'serve_dash.py'),
+                                '--bind', f'127.0.0.1:{port}', '--workers', str(workers)],
+                               cwd=data_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+
+    # Count the workers' ready lines, and keep draining the log so the server never blocks on it
+    ready = []
+
+    def read_log():
+        for line in process.stderr:
+            if 'Worker ready' in line:
+                ready.append(line)
+
+    threading.Thread(target=read_log, daemon=True).start()
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"serve_dash.py exited with status {process.returncode}")
+        if len(ready) >= workers:
+            return process, f'http://127.0.0.1:{port}'
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"serve_dash.py did not answer within {STARTUP_TIMEOUT:.0f}s")
+
+
+# Options of the state and vehicle type dropdowns, read from the app's layout
+def dropdown_options(url):
+    layout = json.loads(urllib.request.urlopen(url + '/_dash-layout').read())
+    options = {}
+
+    def visit(component):
+        if isinstance(component, dict):
+            props = component.get('props', {})
+            if props.get('id') in ('state-dropdown', 'type-dropdown'):
+                options[props['id']] = [option['value'] for option in props.get('options', [])]
+            for value in props.values():
+                visit(value)
+        elif isinstance(component, list):
+            for child in component:
+                visit(child)
+
+    visit(layout)
+    return options['state-dropdown'], options['type-dropdown']
+
+
+# Body of the update_graph callback request a browser sends when a dropdown changes
+def callback_body(state, vehicle_type):
+    return json.dumps({
+        'output': '..sales-graph.figure...sales-payload.children..',
+        'outputs': [{'id': 'sales-graph', 'property': 'figure'}, {'id': 'sales-payload', 'property': 'children'}],
+        'inputs': [{'id': 'state-dropdown', 'property': 'value', 'value': state},
+                   {'id': 'type-dropdown', 'property': 'value', 'value': vehicle_type},
+                   {'id': 'sales-graph', 'property': 'relayoutData', 'value': None}],
+        'changedPropIds': ['state-dropdown.value'],
+        'state': [],
+    }).encode()
+
+
+# Send update_graph callbacks for random state/type selections from several
+# clients at once for a while, returning each request's latency in seconds
+def load(url, pairs, clients=CLIENTS, duration=DURATION, seed=0):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(number):
+        rng = random.Random(seed + number)
+        while time.monotonic() < deadline:
+            request = urllib.request.Request(url + '/_dash-update-component', data=callback_body(*rng.choice(pairs)),
+                                             headers={'Content-Type': 'application/json'})
+            started = time.perf_counter()
+            try:
+                urllib.request.urlopen(request, timeout=120).read()
+            except OSError as error:
+                with lock:
+                    errors.append(repr(error))
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=client, args=(number,)) for number in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+
+# Requests per second and p50/p99 latency of one worker count, starting with an empty shared cache
+def loadtest(workers, data_dir='.', clients=CLIENTS, duration=DURATION, warmup=False):
+    with tempfile.TemporaryDirectory(prefix='dash_cache_') as cache_dir:
+        process, url = start_server(workers, cache_dir, data_dir, warmup)
+        try:
+            states, types = dropdown_options(url)
+            started = time.perf_counter()
+            latencies, errors = load(url, [(state, vtype) for state in states for vtype in types], clients, duration)
+            seconds = time.perf_counter() - started
+        finally:
+            process.terminate()
+            process.wait()
+    latencies = np.asarray(latencies)
+    return {'workers': workers, 'requests': len(latencies), 'errors': len(errors),
+            'requests_per_second': len(latencies) / seconds,
+            'p50_seconds': float(np.percentile(latencies, 50)) if len(latencies) else float('nan'),
+            'p99_seconds': float(np.percentile(latencies, 99)) if len(latencies) else float('nan')}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load test the Dash app's callback under serve_dash.py with different worker counts")
+    parser.add_argument('workers', nargs='*', type=int, default=WORKER_COUNTS, help="worker counts to compare")
+    parser.add_argument('--data-dir', default='.', help="directory holding cars_2024.csv")
+    parser.add_argument('--clients', type=int, default=CLIENTS, help="concurrent clients")
+    parser.add_argument('--duration', type=float, default=DURATION, help="seconds of load per worker count")
+    parser.add_argument('--warmup', action='store_true', help="let the workers warm every figure before and during the test")
+    parser.add_argument('--out', default=None, help="benchmark results file to append the latencies to")
+    args = parser.parse_args()
+
+    results = []
+    for workers in args.workers:
+        result = loadtest(workers, args.data_dir, args.clients, args.duration, args.warmup)
+        results.append(result)
+        print(f"{workers:3d} workers  {result['requests_per_second']:8.1f} req/s  "
+              f"p50 {result['p50_seconds'] * 1000:8.1f} ms  p99 {result['p99_seconds'] * 1000:8.1f} ms  "
+              f"{result['requests']:,} requests  {result['errors']:,} errors")
+
+    if args.out:
+        from benchmark import save_results
+        save_results([{'stage': f"loadtest:{result['workers']}_workers:{percentile}", 'seconds': result[f'{percentile}_seconds']}
+                      for result in results for percentile in ('p50', 'p99')], 0, args.out)
@@ -0,0 +1,72 @@
+import math
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Rows sent to the browser per page
+PAGE_SIZE = 100
+
+
+# Row positions matching a case-insensitive "contains" filter on one column
+def filter_positions(data, column, text):
+    values = data[column]
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # Match the few category labels, then select rows by their codes
+        matches = np.flatnonzero(values.cat.categories.astype(str).str.contains(text, case=False, regex=False))
+        return np.flatnonzero(np.isin(values.cat.codes.to_numpy(), matches))
+    return np.flatnonzero(values.astype(str).str.contains(text, case=False, regex=False).to_numpy())
+
+
+# Row positions in sorted order, with missing values last
+def sort_positions(data, column, positions, ascending=True):
+    values = data[column].iloc[positions]
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        keys = values.cat.codes.to_numpy().astype(np.int64)
+        missing = keys < 0
+    else:
+        keys = values.to_numpy()
+        missing = values.isna().to_numpy()
+    keys = keys[~missing]
+    if ascending:
+        order = np.argsort(keys, kind='stable')
+    else:
+        # Stable ascending order of the reversed keys, read backwards, is descending with ties in row order
+        order = (len(keys) - 1 - np.argsort(keys[::-1], kind='stable'))[::-1]
+    return np.concatenate([positions[~missing][order], positions[missing]])
+
+
+# One page of a frame, optionally restricted to some row positions and sorted,
+# along with the total number of matching rows
+def page_rows(data, page=1, page_size=PAGE_SIZE, sort_by=None, ascending=True, positions=None):
+    total = len(data) if positions is None else len(positions)
+    start = (page - 1) * page_size
+    stop = min(start + page_size, total)
+    if sort_by is None:
+        if positions is None:
+            return data.iloc[start:stop], total
+        return data.take(positions[start:stop]), total
+
+    if positions is None:
+        positions = np.arange(len(data))
+    return data.take(sort_positions(data, sort_by, positions, ascending)[start:stop]), total
+
+
+# Paginated table that keeps the data server-side and only renders the visible page
+def paged_table(data, key, page_size=PAGE_SIZE):
+    columns = list(data.columns)
+    sort_col, order_col, filter_col, text_col = st.columns(4)
+    sort_by = sort_col.selectbox("Sort by", ['(none)'] + columns, key=f"{key}_sort")
+    ascending = order_col.selectbox("Order", ["Ascending", "Descending"], key=f"{key}_order") == "Ascending"
+    filter_column = filter_col.selectbox("Filter column", columns, key=f"{key}_filter_column")
+    filter_text = text_col.text_input("Contains", key=f"{key}_filter_text")
+
+    positions = filter_positions(data, filter_column, filter_text) if filter_text else None
+    total = len(data) if positions is None else len(positions)
+    pages = max(1, math.ceil(total / page_size))
+    page = min(st.number_input("Page", min_value=1, value=1, step=1, key=f"{key}_page"), pages)
+
+    rows, total = page_rows(data, page, page_size, None if sort_by == '(none)' else sort_by, ascending, positions)
+    st.dataframe(rows)
+    first_row = (page - 1) * page_size + 1 if total else 0
+    last_row = first_row + len(rows) - 1 if total else 0
+    st.caption(f"Showing rows {first_row:,}-{last_row:,} of {total:,} (page {page:,} of {pages:,})")
@@ -0,0 +1,91 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+
+# Filter expression for a date range and state/type selection, typed to the file schema
+def scan_filter(schema, start_date=None, end_date=None, states=None, types=None):
+    conditions = []
+    date_type = schema.field('date_reg').type
+    if start_date is not None:
+        conditions.append(ds.field('date_reg') >= _date_scalar(start_date, date_type))
+    if end_date is not None:
+        conditions.append(ds.field('date_reg') <= _date_scalar(end_date, date_type))
+
+    # Partition columns let whole year directories be skipped
+    if 'year' in schema.names and pa.types.is_integer(schema.field('year').type):
+        if start_date is not None:
+            conditions.append(ds.field('year') >= pd.Timestamp(start_date).year)
+        if end_date is not None:
+            conditions.append(ds.field('year') <= pd.Timestamp(end_date).year)
+
+    if states is not None:
+        conditions.append(ds.field('state').isin(list(states)))
+    if types is not None:
+        conditions.append(ds.field('type').isin(list(types)))
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+# Read only the needed columns and row groups of cars.parquet or the partitioned dataset
+def scan_parquet(source, columns=None, start_date=None, end_date=None, states=None, types=None):
+    dataset = ds.dataset(source, format='parquet', partitioning='hive')
+    expression = scan_filter(dataset.schema, start_date, end_date, states, types)
+    if columns is not None:
+        columns = [column for column in columns if column in dataset.schema.names]
+
+    report = {'row_groups_total': 0, 'row_groups_read': 0, 'bytes_total': 0, 'bytes_read': 0}
+    tables = []
+    for fragment in dataset.get_fragments():
+        row_groups = fragment.metadata.num_row_groups
+        report['row_groups_total'] += row_groups
+        report['bytes_total'] += sum(_row_group_bytes(fragment.metadata.row_group(i)) for i in range(row_groups))
+
+        # Skip row groups whose min/max statistics or partition values rule them out
+        for piece in fragment.split_by_row_group(filter=expression, schema=dataset.schema):
+            for row_group in piece.row_groups:
+                report['row_groups_read'] += 1
+                report['bytes_read'] += _row_group_bytes(fragment.metadata.row_group(row_group.id), columns)
+            tables.append(piece.to_table(columns=columns, filter=expression, schema=dataset.schema))
+
+    if tables:
+        table = pa.concat_tables(tables)
+    else:
+        table = dataset.schema.empty_table()
+        if columns is not None:
+            table = table.select(columns)
+    report['rows'] = table.num_rows
+
+    return table, report
+
+
+# Human readable scan report for the dashboard sidebars
+def format_scan_report(report):
+    share = report['bytes_read'] / report['bytes_total'] if report['bytes_total'] else 0.0
+    return (f"Read {report['bytes_read'] / 1024 ** 2:,.1f} of {report['bytes_total'] / 1024 ** 2:,.1f} MB "
+            f"({share:.0%}), {report['row_groups_read']:,} of {report['row_groups_total']:,} row groups")
+
+
+# Compressed bytes of a row group, optionally only for some columns
+def _row_group_bytes(row_group, columns=None):
+    total = 0
+    for i in range(row_group.num_columns):
+        column = row_group.column(i)
+        if columns is None or column.path_in_schema.split('.')[0] in columns:
+            total += column.total_compressed_size
+    return total
+
+
+# Date bound as a scalar comparable with the stored date_reg column
+def _date_scalar(value, date_type):
+    value = pd.Timestamp(value)
+    if pa.types.is_string(date_type) or pa.types.is_large_string(date_type):
+        return value.strftime('%Y-%m-%d')
+    if pa.types.is_date(date_type):
+        return pa.scalar(value.date(), type=date_type)
+    if pa.types.is_timestamp(date_type):
+        return pa.scalar(value.to_pydatetime(), type=date_type)
+    return value.to_pydatetime()
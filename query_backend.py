@@ -0,0 +1,218 @@
+import argparse
+import os
+import time
+import pandas as pd
+from loader import DATASET_DIR, load_registrations, parquet_source
+from cube import CUBE_DIMENSIONS, build_cube
+
+try:
+    import duckdb
+except ImportError:  # DuckDB is optional, the pandas backend is always available
+    duckdb = None
+
+# Backend used when DASHBOARD_BACKEND is not set: DuckDB if installed, else pandas
+DEFAULT_BACKEND = 'duckdb' if duckdb is not None else 'pandas'
+
+
+# Dashboard queries answered with pandas on the loaded frame
+class PandasBackend:
+    name = 'pandas'
+
+    def cube(self, source, freq='D'):
+        return build_cube(load_registrations(source, columns=['date_reg'] + CUBE_DIMENSIONS), freq=freq)
+
+    def year_maker_counts(self, source, start_date=None, end_date=None, state=None, vehicle_type=None):
+        data = self._load(source, ['date_reg', 'maker'], start_date, end_date, state, vehicle_type)
+        counts = data.groupby(['year', 'maker'], observed=True).size().reset_index(name='count')
+        return _plain(counts).sort_values(['year', 'maker'], ignore_index=True)
+
+    def top_makers(self, source, k=5, start_date=None, end_date=None, state=None, vehicle_type=None):
+        data = self._load(source, ['date_reg', 'maker'], start_date, end_date, state, vehicle_type)
+        return _ranked(_plain(data.groupby('maker', observed=True).size().reset_index(name='count')), 'maker').head(k)
+
+    def type_distribution(self, source, start_date=None, end_date=None, state=None, vehicle_type=None):
+        data = self._load(source, ['date_reg', 'type'], start_date, end_date, state, vehicle_type)
+        return _ranked(_plain(data.groupby('type', observed=True).size().reset_index(name='count')), 'type')
+
+    def fuel_kpis(self, source, start_date=None, end_date=None, state=None, vehicle_type=None):
+        data = self._load(source, ['date_reg', 'fuel'], start_date, end_date, state, vehicle_type)
+        kpis = {'total': len(data)}
+        kpis.update({str(fuel): int(count) for fuel, count in data.groupby('fuel', observed=True).size().items()})
+        return kpis
+
+    def _load(self, source, columns, start_date, end_date, state, vehicle_type):
+        columns = columns + [column for column, value in (('state', state), ('type', vehicle_type))
+                             if value is not None and column not in columns]
+        data = load_registrations(source, columns=columns, start_date=start_date, end_date=end_date,
+                                  states=None if state is None else [state],
+                                  types=None if vehicle_type is None else [vehicle_type])
+        return data[data['date_reg'].notna()]
+
+
+# The same queries run by DuckDB directly against the Parquet files, multithreaded
+class DuckDBBackend:
+    name = 'duckdb'
+
+    def __init__(self, threads=None):
+        if duckdb is None:
+            raise ImportError("DuckDB backend requested but the duckdb package is not installed")
+        self.connection = duckdb.connect()
+        if threads is not None:
+            self.connection.execute(f"SET threads = {int(threads)}")
+
+    def cube(self, source, freq='D'):
+        unit = {'D': 'day', 'M': 'month'}[freq]
+        cube = self.connection.execute(f"""
+            SELECT date_trunc('{unit}', TRY_CAST(date_reg AS TIMESTAMP)) AS date_reg, state, type, maker, fuel, count(*) AS count
+            FROM {_relation(source)}
+            GROUP BY ALL
+            ORDER BY ALL NULLS LAST
+        """).df()
+        cube['date_reg'] = cube['date_reg'].astype('datetime64[ns]')
+        cube.insert(1, 'year', cube['date_reg'].dt.year.astype('Int16'))
+        return cube
+
+    def year_maker_counts(self, source, start_date=None, end_date=None, state=None, vehicle_type=None):
+        where, params = _where(start_date, end_date, state, vehicle_type)
+        return _plain(self.connection.execute(f"""
+            SELECT year(TRY_CAST(date_reg AS TIMESTAMP)) AS year, maker, count(*) AS count
+            FROM {_relation(source)} {where}
+            GROUP BY ALL
+            ORDER BY year, maker
+        """, params).df())
+
+    def top_makers(self, source, k=5, start_date=None, end_date=None, state=None, vehicle_type=None):
+        where, params = _where(start_date, end_date, state, vehicle_type)
+        return _plain(self.connection.execute(f"""
+            SELECT maker, count(*) AS count
+            FROM {_relation(source)} {where}
+            GROUP BY ALL
+            ORDER BY count DESC, maker
+            LIMIT {int(k)}
+        """, params).df())
+
+    def type_distribution(self, source, start_date=None, end_date=None, state=None, vehicle_type=None):
+        where, params = _where(start_date, end_date, state, vehicle_type)
+        return _plain(self.connection.execute(f"""
+            SELECT type, count(*) AS count
+            FROM {_relation(source)} {where}
+            GROUP BY ALL
+            ORDER BY count DESC, type
+        """, params).df())
+
+    def fuel_kpis(self, source, start_date=None, end_date=None, state=None, vehicle_type=None):
+        where, params = _where(start_date, end_date, state, vehicle_type)
+        rows = self.connection.execute(f"""
+            SELECT fuel, count(*) AS count
+            FROM {_relation(source)} {where}
+            GROUP BY ALL
+        """, params).fetchall()
+        kpis = {'total': sum(count for _, count in rows)}
+        kpis.update({fuel: count for fuel, count in sorted(rows, key=lambda row: str(row[0])) if fuel is not None})
+        return kpis
+
+
+BACKENDS = {'pandas': PandasBackend, 'duckdb': DuckDBBackend}
+
+
+# Backend named by DASHBOARD_BACKEND, falling back to pandas if DuckDB is unavailable
+def get_backend(name=None):
+    name = name or os.environ.get('DASHBOARD_BACKEND', DEFAULT_BACKEND)
+    if name == 'duckdb' and duckdb is None:
+        name = 'pandas'
+    return BACKENDS[name]()
+
+
+# Run every query on both backends and report any result that differs
+def check_backends(source, filters):
+    pandas_backend, duckdb_backend = PandasBackend(), DuckDBBackend()
+    mismatches = []
+
+    # The cube every dashboard view reads from
+    for freq in ('D', 'M'):
+        expected, actual = (_sorted_cube(backend.cube(source, freq)) for backend in (pandas_backend, duckdb_backend))
+        if not expected.equals(actual):
+            mismatches.append(('cube', {'freq': freq}))
+        print(f"{'cube':<18} {str({'freq': freq}):<70} {'ok' if expected.equals(actual) else 'MISMATCH'}")
+
+    for query in ('year_maker_counts', 'top_makers', 'type_distribution', 'fuel_kpis'):
+        for selection in filters:
+            timings = {}
+            results = {}
+            for backend in (pandas_backend, duckdb_backend):
+                started = time.perf_counter()
+                results[backend.name] = getattr(backend, query)(source, **selection)
+                timings[backend.name] = time.perf_counter() - started
+            expected, actual = results['pandas'], results['duckdb']
+            same = expected == actual if isinstance(expected, dict) else expected.equals(actual)
+            if not same:
+                mismatches.append((query, selection))
+            print(f"{query:<18} {str(selection):<70} {'ok' if same else 'MISMATCH':<8} "
+                  + '  '.join(f"{name} {seconds * 1000:8.1f} ms" for name, seconds in timings.items()))
+    return mismatches
+
+
+# DuckDB relation for cars.parquet or the partition files of the dataset
+def _relation(source):
+    if os.path.isdir(source):
+        path = os.path.join(source, 'year=*', 'month=*', '*.parquet').replace("'", "''")
+        return f"read_parquet('{path}', hive_partitioning = true)"
+    return f"read_parquet('{source.replace(chr(39), chr(39) * 2)}')"
+
+
+# WHERE clause and parameters for a date range and state/type selection
+def _where(start_date, end_date, state, vehicle_type):
+    conditions = ['TRY_CAST(date_reg AS TIMESTAMP) IS NOT NULL']
+    params = []
+    if start_date is not None:
+        conditions.append('TRY_CAST(date_reg AS TIMESTAMP) >= ?')
+        params.append(pd.Timestamp(start_date).to_pydatetime())
+    if end_date is not None:
+        conditions.append('TRY_CAST(date_reg AS TIMESTAMP) <= ?')
+        params.append(pd.Timestamp(end_date).to_pydatetime())
+    if state is not None:
+        conditions.append('state = ?')
+        params.append(state)
+    if vehicle_type is not None:
+        conditions.append('type = ?')
+        params.append(vehicle_type)
+    return 'WHERE ' + ' AND '.join(conditions), params
+
+
+# Cube cells as plain columns sorted by every key, since pandas orders
+# categoricals by their dictionary while DuckDB orders labels alphabetically
+def _sorted_cube(cube):
+    return _plain(cube.drop(columns='year')).sort_values(['date_reg'] + CUBE_DIMENSIONS, na_position='last', ignore_index=True)
+
+
+# Rank counts like value_counts(), breaking ties by label so backends agree;
+# labels must be plain objects to sort alphabetically rather than by category code
+def _ranked(counts, column):
+    return counts.sort_values(['count', column], ascending=[False, True], ignore_index=True)
+
+
+# Plain int64/object columns so results from both backends compare equal
+def _plain(frame):
+    frame = frame.reset_index(drop=True)
+    for column in frame.columns:
+        if column in ('year', 'count'):
+            frame[column] = frame[column].astype('int64')
+        else:
+            frame[column] = frame[column].astype(object)
+    return frame
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check the DuckDB and pandas dashboard backends against each other")
+    parser.add_argument('--data', default=parquet_source(), help=f"cars.parquet or {DATASET_DIR}/")
+    args = parser.parse_args()
+
+    filters = [
+        {},
+        {'start_date': '2024-01-01', 'end_date': '2024-12-31'},
+        {'start_date': '2015-03-01', 'end_date': '2019-10-15', 'state': 'Selangor'},
+        {'state': 'Johor', 'vehicle_type': 'motokar'},
+    ]
+    mismatches = check_backends(args.data, filters)
+    print(f"{len(mismatches)} mismatching results")
+    raise SystemExit(1 if mismatches else 0)
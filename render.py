@@ -0,0 +1,123 @@
+import os
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# Points per figure above which traces are downsampled and drawn with WebGL
+MAX_POINTS = int(os.environ.get('DASHBOARD_MAX_POINTS', '5000'))
+
+# Fewest points a downsampled trace keeps, however many traces share the budget
+MIN_TRACE_POINTS = 100
+
+# Per-point trace attributes that follow the x/y values when points are dropped
+POINT_ATTRIBUTES = ['x', 'y', 'customdata', 'text', 'hovertext']
+
+
+# Downsample a figure's traces above max_points with LTTB and switch its
+# line/marker traces to WebGL. The figure is changed in place and returned;
+# layout.meta keeps the point counts for payload_report().
+def render_figure(fig, max_points=MAX_POINTS, full_resolution=False):
+    points = sum(_trace_points(trace) for trace in fig.data)
+    if points <= max_points:
+        fig.update_layout(meta={'points': points, 'points_shown': points, 'webgl': False})
+        return fig
+
+    budget = max(max_points // max(len(fig.data), 1), MIN_TRACE_POINTS)
+    traces = []
+    for trace in fig.data:
+        if not full_resolution and _trace_points(trace) > budget:
+            trace = _downsample_trace(trace, budget)
+        if trace.type == 'scatter':
+            trace = _webgl_trace(trace)
+        traces.append(trace)
+    fig.data = []
+    fig.add_traces(traces)
+    fig.update_layout(meta={'points': points, 'points_shown': sum(_trace_points(trace) for trace in fig.data),
+                            'webgl': any(trace.type == 'scattergl' for trace in fig.data)})
+    return fig
+
+
+# Positions of the points that Largest-Triangle-Three-Buckets keeps to draw a
+# series with n points: the first and last, and from each bucket in between
+# the point making the largest triangle with the previous pick and the next bucket's mean
+def lttb(x, y, n):
+    count = len(y)
+    if n >= count or n < 3:
+        return np.arange(count)
+    x = _numeric(x)
+    y = np.nan_to_num(np.asarray(y, dtype=np.float64))
+
+    edges = np.linspace(1, count - 1, n - 1).astype(np.int64)
+    selected = np.empty(n, dtype=np.int64)
+    selected[0], selected[-1] = 0, count - 1
+    previous = 0
+    for bucket in range(n - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        next_stop = edges[bucket + 2] if bucket + 2 < len(edges) else count
+        next_x, next_y = x[stop:next_stop].mean(), y[stop:next_stop].mean()
+        areas = np.abs((x[previous] - next_x) * (y[start:stop] - y[previous])
+                       - (x[previous] - x[start:stop]) * (next_y - y[previous]))
+        previous = start + int(areas.argmax())
+        selected[bucket + 1] = previous
+    return selected
+
+
+# Visible x range of a Dash graph's relayoutData after a zoom, or None when zoomed out
+def zoom_range(relayout_data):
+    relayout_data = relayout_data or {}
+    if 'xaxis.range[0]' in relayout_data and 'xaxis.range[1]' in relayout_data:
+        return relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']
+    if 'xaxis.range' in relayout_data:
+        return tuple(relayout_data['xaxis.range'])
+    return None
+
+
+# Size of the JSON sent to the browser for a figure, and how many points it draws
+def payload_report(fig):
+    size = len(fig.to_json())
+    meta = fig.layout.meta or {}
+    points = meta.get('points', sum(_trace_points(trace) for trace in fig.data))
+    shown = meta.get('points_shown', points)
+    report = f"Chart payload: {size / 1024:,.0f} KB, {shown:,} points"
+    if shown < points:
+        report += f" downsampled from {points:,}"
+    if meta.get('webgl'):
+        report += ", WebGL"
+    return report
+
+
+# Number of points a trace draws
+def _trace_points(trace):
+    values = getattr(trace, 'y', None)
+    return 0 if values is None else len(values)
+
+
+# Copy of a trace keeping the n LTTB points of its x/y values
+def _downsample_trace(trace, n):
+    keep = lttb(trace.x if trace.x is not None else np.arange(len(trace.y)), trace.y, n)
+    trace = type(trace)(trace)
+    count = len(trace.y)
+    updates = {}
+    for attribute in POINT_ATTRIBUTES:
+        values = getattr(trace, attribute, None)
+        if values is not None and not isinstance(values, str) and len(values) == count:
+            updates[attribute] = np.asarray(values)[keep]
+    return trace.update(updates, overwrite=True)
+
+
+# WebGL copy of a scatter trace, dropping the few attributes Scattergl lacks
+def _webgl_trace(trace):
+    properties = trace.to_plotly_json()
+    properties.pop('type', None)
+    return go.Scattergl(properties, skip_invalid=True)
+
+
+# Values of an x axis as floats: numbers, timestamps in nanoseconds, or positions for labels
+def _numeric(values):
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.number):
+        return values.astype(np.float64)
+    try:
+        return pd.to_datetime(values).asi8.astype(np.float64)
+    except (TypeError, ValueError):
+        return np.arange(len(values), dtype=np.float64)
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+# Both functions below assume the frame is sorted by date_reg with missing
+# dates last, as returned by load_registrations() and build_cube()
+
+
+# Row positions [lo, hi) of the rows registered between two dates, inclusive
+def date_bounds(data, start_date=None, end_date=None):
+    dates = data['date_reg'].to_numpy()
+    lo = 0 if start_date is None else np.searchsorted(dates, np.datetime64(pd.Timestamp(start_date)), side='left')
+    if end_date is None:
+        hi = np.searchsorted(dates, np.datetime64('NaT'), side='left')
+    else:
+        hi = np.searchsorted(dates, np.datetime64(pd.Timestamp(end_date)), side='right')
+    return int(lo), int(hi)
+
+
+# Zero-copy slice of the rows registered between two dates, inclusive
+def date_slice(data, start_date=None, end_date=None):
+    lo, hi = date_bounds(data, start_date, end_date)
+    return data.iloc[lo:hi]
+
+
+# First and last registration date, ignoring missing dates
+def date_extent(data):
+    lo, hi = date_bounds(data)
+    dates = data['date_reg']
+    return dates.iloc[lo], dates.iloc[hi - 1]
+
+
+# Date-ordered row positions for every (state, type) combination
+def build_segment_index(data, by=('state', 'type')):
+    return data.groupby(list(by), observed=True, sort=False).indices
+
+
+# Rows of one (state, type) segment, optionally restricted to a date range
+def select_segment(data, segment_index, key, start_date=None, end_date=None):
+    positions = segment_index.get(tuple(key), np.empty(0, dtype=np.intp))
+    if start_date is not None or end_date is not None:
+        lo, hi = date_bounds(data, start_date, end_date)
+        positions = positions[np.searchsorted(positions, lo):np.searchsorted(positions, hi)]
+    return data.take(positions)
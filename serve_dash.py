@@ -0,0 +1,103 @@
+import argparse
+import importlib.util
+import os
+
+try:
+    from flask_caching import Cache
+except ImportError:  # flask-caching is optional, figures are then only memoized per process
+    Cache = None
+
+# Directory the repository's scripts live in
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Address and number of gunicorn worker processes serving the Dash app
+BIND = os.environ.get('DASH_BIND', '127.0.0.1:8050')
+WORKERS = int(os.environ.get('DASH_WORKERS', '4'))
+
+# Callback results shared by every worker: a flask-caching backend and where it keeps them.
+# FileSystemCache needs nothing else running; RedisCache reads DASH_CACHE_REDIS_URL.
+CACHE_TYPE = os.environ.get('DASH_CACHE_TYPE', 'FileSystemCache')
+CACHE_DIR = os.environ.get('DASH_CACHE_DIR', '.dash_cache')
+CACHE_REDIS_URL = os.environ.get('DASH_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+
+# Results kept in the shared cache at most; keys carry the data version, so nothing needs to expire
+CACHE_THRESHOLD = int(os.environ.get('DASH_CACHE_THRESHOLD', '1000'))
+
+
+# Cache shared by every worker process serving a Flask server, or None
+# without flask-caching or with DASH_CACHE_TYPE set to NullCache
+def shared_cache(server, cache_type=CACHE_TYPE, cache_dir=CACHE_DIR):
+    if Cache is None or cache_type == 'NullCache':
+        return None
+    config = {'CACHE_TYPE': cache_type, 'CACHE_DEFAULT_TIMEOUT': 0, 'CACHE_THRESHOLD': CACHE_THRESHOLD}
+    if cache_type == 'FileSystemCache':
+        config['CACHE_DIR'] = cache_dir
+    elif cache_type == 'RedisCache':
+        config['CACHE_REDIS_URL'] = CACHE_REDIS_URL
+    return Cache(server, config=config)
+
+
+# Result of build() under a key, computed by whichever worker asks first and
+# read from the shared cache by the others. Without a cache it is just build().
+def cached_result(cache, key, build):
+    if cache is None:
+        return build()
+    key = repr(key)
+    result = cache.get(key)
+    if result is None:
+        result = build()
+        cache.set(key, result)
+    return result
+
+
+# Import 001.py, the Dash app, as a module
+def load_app(path=os.path.join(REPO_DIR, '001.py')):
+    spec = importlib.util.spec_from_file_location('dash_app', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.app
+
+
+# WSGI application for gunicorn's own command line: gunicorn -w 4 'serve_dash:wsgi_app()'
+def wsgi_app():
+    # Workers start taking requests once loaded, so pay for plotly.express up front: imported lazily,
+    # the warm-up thread would still be importing it while the first requests serialize figures
+    importlib.import_module('plotly.express')
+    return load_app().server
+
+
+# Serve the Dash app with gunicorn worker processes. Every worker imports the
+# app itself, mapping the shared cube from .shared_data/ and running its own
+# warm-up, which mostly reads figures other workers already put in the shared cache.
+def serve(bind=BIND, workers=WORKERS, timeout=120):
+    from gunicorn.app.base import BaseApplication
+
+    class DashApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', bind)
+            self.cfg.set('workers', workers)
+            self.cfg.set('timeout', timeout)
+            self.cfg.set('post_worker_init', _worker_ready)
+
+        def load(self):
+            return wsgi_app()
+
+    DashApplication().run()
+
+
+# Log each worker once it has imported the app and starts taking requests
+def _worker_ready(worker):
+    worker.log.info("Worker ready (pid: %s)", worker.pid)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve the Dash app (001.py) with gunicorn workers sharing a result cache")
+    parser.add_argument('--bind', default=BIND, help="address to listen on")
+    parser.add_argument('--workers', type=int, default=WORKERS, help="number of worker processes")
+    parser.add_argument('--cache-dir', default=None, help="directory of the shared FileSystemCache")
+    args = parser.parse_args()
+
+    # Workers read the cache settings from the environment when they import the app
+    if args.cache_dir:
+        os.environ['DASH_CACHE_DIR'] = args.cache_dir
+    serve(args.bind, args.workers)
@@ -0,0 +1,87 @@
+import glob
+import hashlib
+import os
+import sys
+import pyarrow as pa
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Directory holding the Arrow IPC files every session and worker maps
+SHARED_DIR = os.environ.get('SHARED_DATA_DIR', '.shared_data')
+
+# Largest dataset in MB a worker may map, 0 for no limit
+MEMORY_BUDGET_MB = float(os.environ.get('SHARED_DATA_BUDGET_MB', '0'))
+
+# Files mapped by this process, for the memory report
+_mapped = {}
+
+
+# Path of the shared file for a dataset name and version
+def shared_path(name, version, shared_dir=SHARED_DIR):
+    digest = hashlib.sha256(repr(version).encode()).hexdigest()[:16]
+    return os.path.join(shared_dir, f"{name}-{digest}.arrow")
+
+
+# Write a frame once as an uncompressed Arrow IPC file that can be memory-mapped
+def export_shared(data, path):
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(temporary_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(temporary_path, path)
+
+
+# Map a shared file read-only. Date, numeric and categorical code columns
+# without missing values point straight into the page cache instead of
+# being copied into this process.
+def map_shared(path, budget_mb=MEMORY_BUDGET_MB):
+    size = os.path.getsize(path)
+    if budget_mb and size > budget_mb * 1024 ** 2:
+        raise MemoryError(f"{path} is {size / 1024 ** 2:,.1f} MB, over the {budget_mb:,.0f} MB shared data budget "
+                          f"(SHARED_DATA_BUDGET_MB)")
+    table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    _mapped[path] = size
+    return table.to_pandas(split_blocks=True)
+
+
+# Frame for a dataset version, built and exported by the first process that needs it
+def load_shared(name, version, build, shared_dir=SHARED_DIR, budget_mb=MEMORY_BUDGET_MB):
+    path = shared_path(name, version, shared_dir)
+    if not os.path.exists(path):
+        export_shared(build(), path)
+
+        # Older versions can go; processes still mapping them keep their pages
+        for stale_path in glob.glob(os.path.join(shared_dir, f"{name}-{'[0-9a-f]' * 16}.arrow")):
+            if stale_path != path:
+                os.remove(stale_path)
+    return map_shared(path, budget_mb)
+
+
+# Resident, private and shared memory of this worker in MB
+def memory_report():
+    report = {'pid': os.getpid(), 'mapped_mb': sum(_mapped.values()) / 1024 ** 2}
+    try:
+        with open('/proc/self/status') as f:
+            fields = dict(line.split(':', 1) for line in f)
+        kilobytes = {name: int(fields[name].split()[0]) for name in ('VmRSS', 'RssAnon', 'RssFile', 'RssShmem') if name in fields}
+        report['resident_mb'] = kilobytes['VmRSS'] / 1024
+        report['private_mb'] = kilobytes.get('RssAnon', 0) / 1024
+        report['shared_mb'] = (kilobytes.get('RssFile', 0) + kilobytes.get('RssShmem', 0)) / 1024
+    except (OSError, KeyError):
+        # No /proc (macOS, Windows): only the peak resident size is available
+        if resource is not None:
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            report['resident_mb'] = peak / (1024 ** 2 if sys.platform == 'darwin' else 1024)
+    return report
+
+
+# One line memory report for the dashboard sidebars
+def format_memory_report(report):
+    text = f"Worker {report['pid']}: {report.get('resident_mb', 0.0):,.1f} MB resident"
+    if 'shared_mb' in report:
+        text += f" ({report['private_mb']:,.1f} MB private, {report['shared_mb']:,.1f} MB shared)"
+    return text + f", {report['mapped_mb']:,.1f} MB dataset mapped"
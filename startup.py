@@ -0,0 +1,118 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Directory the repository's scripts live in
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Apps profiled when none are given: the Dash app and every Streamlit dashboard
+APPS = ['001.py', '002.py', '003.py', '01.py', '02.py', '03.py', '03a.py', '03b.py', '03c.py']
+
+# Seconds from a fresh interpreter to an app's first complete render
+STARTUP_BUDGET = float(os.environ.get('STARTUP_BUDGET', '10'))
+
+# Imports listed per app in the breakdown
+TOP_IMPORTS = 10
+
+
+# Start an app in a fresh interpreter and time its first render, with the
+# import time of every package it loaded on the way
+def profile_app(app, data_dir='.'):
+    started = time.perf_counter()
+    process = subprocess.run([sys.executable, '-X', 'importtime', os.path.abspath(__file__), '--render', app],
+                             cwd=data_dir, capture_output=True, text=True)
+    result = {'app': app, 'cold_start_seconds': time.perf_counter() - started}
+    try:
+        result.update(json.loads(process.stdout.strip().splitlines()[-1]))
+    except (IndexError, json.JSONDecodeError):
+        messages = [line for line in process.stderr.splitlines() if line.strip() and not line.startswith('import time:')]
+        result['error'] = messages[-1] if messages else f"exited with status {process.returncode}"
+
+    imports = import_times(process.stderr)
+    result['import_seconds'] = sum(imports.values())
+    result['imports'] = dict(sorted(imports.items(), key=lambda item: -item[1]))
+    return result
+
+
+# Seconds spent importing each top-level package, from -X importtime output.
+# Only imports made directly by the app or a lazy import site are counted,
+# since their cumulative time already includes everything they imported.
+def import_times(stderr):
+    totals = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if name.startswith('  '):
+            continue
+        package = name.strip().split('.')[0]
+        totals[package] = totals.get(package, 0.0) + int(cumulative) / 1e6
+    return totals
+
+
+# Render an app once in this process and print how long it took, for profile_app()
+def first_render(app):
+    started = time.perf_counter()
+    path = os.path.join(REPO_DIR, app)
+    result = {}
+    if app == '001.py':
+        # Import the Dash app without starting its server, then serve the page and its first figure
+        import importlib.util
+        spec = importlib.util.spec_from_file_location('dash_app', path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        client = module.app.server.test_client()
+        client.get('/')
+        client.get('/_dash-layout')
+        module.update_graph(module.states[0], module.types[0])
+    else:
+        from streamlit.testing.v1 import AppTest
+        test = AppTest.from_file(path, default_timeout=3600).run()
+        if test.exception:
+            result['error'] = test.exception[0].message
+    result['first_render_seconds'] = time.perf_counter() - started
+    print(json.dumps(result))
+
+
+# Apps over budget or failing to render
+def over_budget(results, budget=STARTUP_BUDGET):
+    return [result for result in results if 'error' in result or result['cold_start_seconds'] > budget]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Profile the dashboards' cold start: import time and time to first render")
+    parser.add_argument('apps', nargs='*', default=APPS, help="apps to profile (default: all)")
+    parser.add_argument('--data-dir', default='.', help="directory holding the apps' data files")
+    parser.add_argument('--budget', type=float, default=STARTUP_BUDGET, help="cold start budget in seconds per app")
+    parser.add_argument('--imports', type=int, default=TOP_IMPORTS, help="slowest imports listed per app")
+    parser.add_argument('--out', default=None, help="benchmark results file to append the timings to")
+    parser.add_argument('--render', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.render:
+        first_render(args.render)
+        raise SystemExit(0)
+
+    results = [profile_app(app, args.data_dir) for app in args.apps]
+    slow = over_budget(results, args.budget)
+    for result in results:
+        status = 'over budget' if result in slow else 'ok'
+        print(f"{result['app']:<8} cold start {result['cold_start_seconds']:6.2f}s  "
+              f"first render {result.get('first_render_seconds', float('nan')):6.2f}s  "
+              f"imports {result['import_seconds']:6.2f}s  {status}  {result.get('error', '')}")
+        for package, seconds in list(result['imports'].items())[:args.imports]:
+            print(f"{'':8} {package:<32} {seconds:6.3f}s")
+
+    if args.out:
+        from benchmark import save_results
+        # Cold starts run on the data in --data-dir rather than a generated size
+        save_results([{'stage': f"startup:{result['app']}{suffix}", 'seconds': result[field]}
+                      for result in results
+                      for suffix, field in (('', 'cold_start_seconds'), (':imports', 'import_seconds'))], 0, args.out)
+
+    if slow:
+        print(f"\n{len(slow)} apps over the {args.budget:.1f}s cold start budget: {', '.join(result['app'] for result in slow)}")
+    raise SystemExit(1 if slow else 0)
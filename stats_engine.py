@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+from row_index import date_slice
+
+# Centroids kept per partition and column; quantile rank error is at most 1/SKETCH_SIZE
+SKETCH_SIZE = 100
+
+# Rows of the statistics table, in the order describe() uses
+STATISTICS = ['count', 'mean', 'min', '25%', '50%', '75%', 'max', 'std']
+
+
+# Mergeable per-partition summaries of every numeric and date column.
+# Partitions are (day, state, type), so any slider range and dropdown
+# selection is a union of whole partitions. With weights, each row stands
+# for that many identical rows, e.g. a cube cell and its count.
+def build_summaries(data, by=('state', 'type'), columns=None, weights=None, sketch_size=SKETCH_SIZE):
+    if columns is None:
+        columns = [column for column in data.columns if column != weights and
+                   (pd.api.types.is_numeric_dtype(data[column]) or pd.api.types.is_datetime64_any_dtype(data[column]))]
+    weights = np.ones(len(data), dtype=np.int64) if weights is None else data[weights].to_numpy(dtype=np.int64)
+
+    keys = pd.DataFrame({'date_reg': data['date_reg'].dt.normalize()})
+    for column in by:
+        keys[column] = data[column].to_numpy()
+    keys['rows'] = weights
+    grouped = keys.groupby(['date_reg'] + list(by), observed=True, dropna=False, sort=True)
+    partition_ids = grouped.ngroup().to_numpy()
+    partitions = grouped['rows'].sum().reset_index()
+
+    summaries = {'partitions': partitions, 'by': list(by), 'moments': {}, 'centroids': {}, 'datetime': []}
+    for column in columns:
+        values = data[column]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            summaries['datetime'].append(column)
+            valid = values.notna().to_numpy()
+            values = values.to_numpy().astype('datetime64[ns]').astype(np.int64)
+        else:
+            valid = values.notna().to_numpy()
+            values = values.to_numpy(dtype=float, na_value=np.nan)
+        frame = pd.DataFrame({'partition': partition_ids[valid], 'value': values[valid].astype(float), 'weight': weights[valid]})
+
+        # Equal values of a partition collapse into one weighted value, so a
+        # column that is constant within each partition (a date, its year or month) keeps one per partition
+        distinct = frame.groupby(['partition', 'value'], sort=True)['weight'].sum().reset_index()
+        summaries['moments'][column] = _moments(distinct, len(partitions))
+        summaries['centroids'][column] = _centroids(distinct, sketch_size)
+    return summaries
+
+
+# The same summaries from a daily cube, each cell weighted by its count,
+# for data that is only ever streamed into aggregates
+def build_cube_summaries(cube, by=('state', 'type'), sketch_size=SKETCH_SIZE):
+    cells = cube.assign(month=cube['date_reg'].dt.month.astype('Int8'))
+    return build_summaries(cells, by, columns=['date_reg', 'year', 'month'], weights='count', sketch_size=sketch_size)
+
+
+# describe()-style statistics for a date range and state/type selection, merged from partition summaries
+def describe_selection(summaries, start_date=None, end_date=None, state=None, vehicle_type=None):
+    partitions = summaries['partitions']
+    if start_date is not None or end_date is not None:
+        partitions = date_slice(partitions, start_date, end_date)
+    if state is not None:
+        partitions = partitions[partitions['state'] == state]
+    if vehicle_type is not None:
+        partitions = partitions[partitions['type'] == vehicle_type]
+    selected = np.zeros(len(summaries['partitions']), dtype=bool)
+    selected[partitions.index.to_numpy()] = True
+
+    table = {}
+    for column, moments in summaries['moments'].items():
+        stats = _merge(moments, summaries['centroids'][column], selected)
+        if column in summaries['datetime']:
+            # Dates as ISO strings, so every column has one type and the table serializes to Arrow
+            table[column] = ([str(stats['count'])]
+                             + [str(pd.NaT) if pd.isna(stats[name]) else pd.Timestamp(int(stats[name])).isoformat()
+                                for name in STATISTICS[1:-1]]
+                             + [str(pd.Timedelta(stats['std'], unit='ns')) if pd.notna(stats['std']) else str(pd.NaT)])
+        else:
+            table[column] = pd.Series([stats[name] for name in STATISTICS], index=STATISTICS, dtype='float64')
+    return pd.DataFrame(table, index=STATISTICS)
+
+
+# Count, mean, centred sum of squares, min and max per partition, as arrays
+# indexed by partition; partitions without a value have a count of 0
+def _moments(frame, partitions):
+    grouped = frame.groupby('partition').agg(count=('weight', 'sum'), min=('value', 'min'), max=('value', 'max'))
+    grouped['mean'] = _weighted_mean(frame, ['partition'])
+    deviation = frame['value'].to_numpy() - grouped['mean'].reindex(frame['partition']).to_numpy()
+    grouped['m2'] = (frame['weight'] * deviation ** 2).groupby(frame['partition']).sum()
+
+    moments = {'count': np.zeros(partitions, dtype=np.int64)}
+    moments['count'][grouped.index.to_numpy()] = grouped['count'].to_numpy()
+    for name in ('mean', 'm2', 'min', 'max'):
+        moments[name] = np.full(partitions, np.nan)
+        moments[name][grouped.index.to_numpy()] = grouped[name].to_numpy()
+    return moments
+
+
+# Weighted centroids of every partition's distinct values, sorted by value
+# across all partitions so a selection's quantiles need no sort. A partition
+# with more than sketch_size distinct values keeps sketch_size centroids of
+# equal weight, with quantile rank error at most 1/sketch_size.
+def _centroids(distinct, sketch_size):
+    weights = distinct.groupby('partition')['weight']
+    sizes = distinct.groupby('partition')['value'].transform('size').to_numpy()
+    counts = weights.transform('sum').to_numpy()
+    ranks = weights.cumsum().to_numpy() - distinct['weight'].to_numpy()
+    positions = distinct.groupby('partition').cumcount().to_numpy()
+    distinct = distinct.assign(bucket=np.where(sizes > sketch_size, ranks * sketch_size // counts, positions))
+
+    centroids = distinct.groupby(['partition', 'bucket'])['weight'].sum().to_frame()
+    centroids['mean'] = _weighted_mean(distinct, ['partition', 'bucket'])
+    centroids = centroids.reset_index().sort_values('mean', kind='stable')
+    return {'partition': centroids['partition'].to_numpy(), 'mean': centroids['mean'].to_numpy(),
+            'weight': centroids['weight'].to_numpy()}
+
+
+# Weighted mean per group, taken relative to the group's first value
+# so that a group of identical values (e.g. dates) keeps its value exactly
+def _weighted_mean(frame, by):
+    grouped = frame.groupby(by)
+    deviation = frame['weight'] * (frame['value'] - grouped['value'].transform('first'))
+    return grouped['value'].first() + deviation.groupby([frame[column] for column in by]).sum() / grouped['weight'].sum()
+
+
+# Merge the summaries of the selected partitions into one set of statistics
+def _merge(moments, centroids, selected):
+    selected = selected & (moments['count'] > 0)
+    counts = moments['count'][selected]
+    count = counts.sum()
+    stats = dict.fromkeys(STATISTICS, np.nan)
+    stats['count'] = int(count)
+    if count == 0:
+        return stats
+
+    # Parallel variance: within-partition plus between-partition sums of squares
+    means = moments['mean'][selected]
+    mean = (counts * means).sum() / count
+    m2 = moments['m2'][selected].sum() + (counts * (means - mean) ** 2).sum()
+    stats.update(mean=mean, min=moments['min'][selected].min(), max=moments['max'][selected].max(),
+                 std=np.sqrt(m2 / (count - 1)) if count > 1 else np.nan)
+
+    # Quantiles interpolated between order statistics, as pandas does
+    keep = selected[centroids['partition']]
+    values = centroids['mean'][keep]
+    cumulative = np.cumsum(centroids['weight'][keep])
+    for name, q in (('25%', 0.25), ('50%', 0.5), ('75%', 0.75)):
+        rank = q * (count - 1)
+        lower = values[np.searchsorted(cumulative, np.floor(rank), side='right')]
+        upper = values[np.searchsorted(cumulative, np.ceil(rank), side='right')]
+        stats[name] = lower + (upper - lower) * (rank - np.floor(rank))
+    return stats
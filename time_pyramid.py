@@ -0,0 +1,157 @@
+import os
+import numpy as np
+import pandas as pd
+from row_index import build_segment_index, date_slice, select_segment
+from cube import CUBE_DIMENSIONS, count_by
+
+# Time grains of the pyramid, finest first, with the days one period spans on average
+LEVELS = {'D': 1.0, 'W': 7.0, 'M': 30.4375, 'Y': 365.25}
+
+# Names of the time grains for chart labels
+LEVEL_NAMES = {'D': 'Day', 'W': 'Week', 'M': 'Month', 'Y': 'Year'}
+
+# Periods per series a time chart draws at most when its grain is picked from the window width
+PYRAMID_MAX_PERIODS = int(os.environ.get('PYRAMID_MAX_PERIODS', '400'))
+
+
+# Registration counts per day, week, month and year of every (state, type)
+# segment and maker, plus running totals over the days per value of each cube
+# dimension and per segment, so the counts of any date range are one subtraction.
+# Built from the daily or monthly cube; cells without a date are left out.
+def build_pyramid(cube, by=('state', 'type'), detail='maker'):
+    by = list(by)
+    cube = date_slice(cube)
+    dates = cube['date_reg'].to_numpy().astype('datetime64[D]')
+    first_day = dates.min() if len(dates) else np.datetime64('NaT', 'D')
+    day_ids = (dates - first_day).astype(np.int64)
+    days = pd.DatetimeIndex(np.arange(first_day, first_day + (day_ids.max() + 1 if len(dates) else 0)))
+
+    # One cube per grain with its dates truncated to the period start, and its segment positions
+    levels = {}
+    for freq in LEVELS:
+        cells = cube[by + [detail, 'count']].copy()
+        cells.insert(0, 'date_reg', _period_start(cube['date_reg'].to_numpy(), freq))
+        level = cells.groupby(['date_reg'] + by + [detail], observed=True, dropna=False)['count'].sum().reset_index()
+        levels[freq] = {'cube': level, 'segments': build_segment_index(level, by)}
+
+    # Running totals over the days per dimension value, missing values in the last column
+    labels = {}
+    cumulative = {}
+    columns = [column for column in CUBE_DIMENSIONS if column in cube.columns]
+    segment_keys = pd.MultiIndex.from_frame(cube[by].astype(object)) if len(by) > 1 else cube[by[0]]
+    for name, values in [(column, cube[column]) for column in columns] + [('segment', segment_keys)]:
+        labels[name], ids = _labels(values)
+        counts = np.zeros((len(days) + 1, len(labels[name]) + 1), dtype=np.int64)
+        np.add.at(counts, (day_ids + 1, ids), cube['count'].to_numpy())
+        cumulative[name] = counts.cumsum(axis=0)
+    return {'days': days, 'by': by, 'detail': detail, 'levels': levels, 'labels': labels, 'cumulative': cumulative}
+
+
+# Registrations per value of a cube dimension, or per segment with
+# column='segment', between two dates inclusive, without touching the cube
+def range_counts(pyramid, column, start_date=None, end_date=None):
+    lo, hi = _day_bounds(pyramid, start_date, end_date)
+    cumulative = pyramid['cumulative'][column]
+    counts = cumulative[hi, :-1] - cumulative[lo, :-1]
+    return pd.Series(counts, index=pyramid['labels'][column], name='count')
+
+
+# Total registrations between two dates inclusive, including cells with missing dimension values
+def range_total(pyramid, start_date=None, end_date=None):
+    lo, hi = _day_bounds(pyramid, start_date, end_date)
+    cumulative = next(iter(pyramid['cumulative'].values()))
+    return int(cumulative[hi].sum() - cumulative[lo].sum())
+
+
+# Coarsest grain that still keeps a window under max_periods points, finest first
+def pick_resolution(start_date, end_date, max_periods=PYRAMID_MAX_PERIODS):
+    days = (pd.Timestamp(end_date) - pd.Timestamp(start_date)).days + 1
+    for freq, period_days in LEVELS.items():
+        if days / period_days <= max_periods:
+            return freq
+    return 'Y'
+
+
+# Registrations per period between two dates inclusive, optionally of one
+# segment and split by the detail column, indexed by the period start. Whole
+# periods come from the pyramid level; the days of the periods cut by the range
+# come from the daily level, so edge periods only count the selected days.
+# freq=None picks the grain from the width of the range.
+def time_series(pyramid, start_date=None, end_date=None, segment=None, freq=None, split=False):
+    days = pyramid['days']
+    if not len(days):
+        return pd.Series(dtype=np.int64, name='count')
+    start = days[0] if start_date is None else max(pd.Timestamp(start_date).normalize(), days[0])
+    end = days[-1] if end_date is None else min(pd.Timestamp(end_date).normalize(), days[-1])
+    freq = pick_resolution(start, end) if freq is None else freq
+
+    # Whole periods run from the first period starting in the range to the last one ending in it
+    whole_start = pd.Timestamp(_period_start(np.array([start.to_datetime64()]), freq)[0])
+    if whole_start < start:
+        whole_start = _next_period(whole_start, freq)
+    whole_end = pd.Timestamp(_period_start(np.array([(end + pd.Timedelta(days=1)).to_datetime64()]), freq)[0])
+
+    parts = []
+    if whole_start < whole_end:
+        parts.append(_level_cells(pyramid, freq, segment, whole_start, whole_end - pd.Timedelta(days=1)))
+        edges = [(start, whole_start - pd.Timedelta(days=1)), (whole_end, end)]
+    else:
+        edges = [(start, end)]
+    for edge_start, edge_end in edges:
+        if edge_start <= edge_end and freq != 'D':
+            cells = _level_cells(pyramid, 'D', segment, edge_start, edge_end)
+            parts.append(cells.assign(date_reg=_period_start(cells['date_reg'].to_numpy(), freq)))
+
+    cells = pd.concat(parts, ignore_index=True) if parts else _level_cells(pyramid, freq, segment, start, end).iloc[:0]
+    by = ['date_reg', pyramid['detail']] if split else 'date_reg'
+    return count_by(cells, by).rename('count')
+
+
+# Cells of one pyramid level between two dates, of one segment or all of them
+def _level_cells(pyramid, freq, segment, start_date, end_date):
+    level = pyramid['levels'][freq]
+    if segment is None:
+        return date_slice(level['cube'], start_date, end_date)
+    return select_segment(level['cube'], level['segments'], segment, start_date, end_date)
+
+
+# Positions [lo, hi) of two dates in the running totals
+def _day_bounds(pyramid, start_date, end_date):
+    days = pyramid['days']
+    lo = 0 if start_date is None else int(days.searchsorted(pd.Timestamp(start_date).normalize(), side='left'))
+    hi = len(days) if end_date is None else int(days.searchsorted(pd.Timestamp(end_date).normalize(), side='right'))
+    return lo, max(lo, hi)
+
+
+# Start of the day, week (Monday), month or year each date falls in
+def _period_start(dates, freq):
+    days = np.asarray(dates).astype('datetime64[D]')
+    if freq == 'W':
+        # Day 0 of numpy's calendar, 1970-01-01, was a Thursday
+        days = days - (days.astype(np.int64) + 3) % 7
+    elif freq in ('M', 'Y'):
+        days = days.astype(f'datetime64[{freq}]').astype('datetime64[D]')
+    return days.astype('datetime64[ns]')
+
+
+# Start of the period after the one starting at a date
+def _next_period(start, freq):
+    if freq == 'W':
+        return start + pd.Timedelta(days=7)
+    if freq == 'M':
+        return start + pd.DateOffset(months=1)
+    if freq == 'Y':
+        return start + pd.DateOffset(years=1)
+    return start + pd.Timedelta(days=1)
+
+
+# Sorted labels of a column and each cell's label position, missing values last
+def _labels(values):
+    if isinstance(values, pd.MultiIndex):
+        labels = values[~values.to_frame().isna().any(axis=1).to_numpy()].unique().sort_values()
+        ids = labels.get_indexer(values).astype(np.int64)
+    else:
+        labels = pd.Index(values.dropna().unique()).sort_values().rename(values.name)
+        ids = pd.Categorical(values, categories=labels).codes.astype(np.int64)
+    ids[ids < 0] = len(labels)
+    return labels, ids
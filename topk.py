@@ -0,0 +1,106 @@
+import os
+import numpy as np
+import pandas as pd
+from row_index import date_slice
+
+# Makers shown in the top makers charts
+TOP_K = int(os.environ.get('TOP_K', '5'))
+
+
+# Maker counts per month of every (state, type) segment that occurs, summed
+# cumulatively over the months so the counts of any run of whole months are one
+# subtraction. Built from the daily cube, which the index keeps to count the
+# days of partially selected months. Cells without a date are left out.
+def build_topk_index(cube):
+    cube = date_slice(cube)
+    months = cube['date_reg'].to_numpy().astype('datetime64[M]')
+    first_month = months.min() if len(months) else np.datetime64('NaT', 'M')
+    month_ids = (months - first_month).astype(np.int64)
+    month_starts = pd.DatetimeIndex(np.arange(first_month, first_month + (month_ids.max() + 1 if len(months) else 0)))
+
+    states, state_ids = _labels(cube['state'])
+    types, type_ids = _labels(cube['type'])
+    makers, maker_ids = _labels(cube['maker'])
+
+    # Rows without a maker are not ranked, like value_counts() leaves out missing values
+    known = maker_ids < len(makers)
+    weights = cube['count'].to_numpy()[known]
+
+    # Only the segments present get a slice, most of the state x type grid never occurs
+    keys = state_ids[known] * (len(types) + 1) + type_ids[known]
+    segments = np.flatnonzero(np.bincount(keys, minlength=(len(states) + 1) * (len(types) + 1)))
+    segment_ids = np.searchsorted(segments, keys)
+    dtype = np.int32 if weights.sum() <= np.iinfo(np.int32).max else np.int64
+    counts = np.zeros((len(month_starts) + 1, len(segments), len(makers)), dtype=dtype)
+    np.add.at(counts, (month_ids[known] + 1, segment_ids, maker_ids[known]), weights.astype(dtype))
+    np.cumsum(counts, axis=0, dtype=dtype, out=counts)
+    return {'months': month_starts, 'states': states, 'types': types, 'makers': makers,
+            'segment_states': segments // (len(types) + 1), 'segment_types': segments % (len(types) + 1),
+            'cumulative': counts, 'cube': cube}
+
+
+# Registrations per maker for a date range, year and state/type selection
+def maker_counts(index, start_date=None, end_date=None, state=None, vehicle_type=None, year=None):
+    months = index['months']
+    if not len(months):
+        return pd.Series(0, index=index['makers'], name='count', dtype=np.int64)
+    start = months[0] if start_date is None else pd.Timestamp(start_date)
+    end = months[-1] + pd.offsets.MonthEnd(0) if end_date is None else pd.Timestamp(end_date)
+    if year is not None:
+        start = max(start, pd.Timestamp(year=year, month=1, day=1))
+        end = min(end, pd.Timestamp(year=year, month=12, day=31))
+
+    # Whole months inside the range come from the cumulative counts
+    first = int(months.searchsorted(start, side='left'))
+    last = int(months.searchsorted(end.normalize() + pd.Timedelta(days=1) - pd.DateOffset(months=1), side='right'))
+    counts = np.zeros(len(index['makers']), dtype=np.int64)
+    if last > first:
+        cumulative = index['cumulative']
+        selected = (_selection(index['states'], index['segment_states'], state)
+                    & _selection(index['types'], index['segment_types'], vehicle_type))
+        counts += (cumulative[last, selected] - cumulative[first, selected]).sum(axis=0, dtype=np.int64)
+
+        # Days of the partially selected months on either side come from the daily cube
+        edges = [(start, months[first] - pd.Timedelta(days=1))]
+        if last < len(months):
+            edges.append((months[last], end))
+    else:
+        edges = [(start, end)]
+    for edge_start, edge_end in edges:
+        if edge_start <= edge_end:
+            counts += _cube_counts(index, edge_start, edge_end, state, vehicle_type)
+    return pd.Series(counts, index=index['makers'], name='count')
+
+
+# The k makers with the most registrations in a selection, largest first
+def top_makers(index, k=TOP_K, start_date=None, end_date=None, state=None, vehicle_type=None, year=None):
+    counts = maker_counts(index, start_date, end_date, state, vehicle_type, year)
+    return counts[counts > 0].nlargest(k)
+
+
+# Maker counts of the cube cells in a date range, for the days outside whole months
+def _cube_counts(index, start_date, end_date, state, vehicle_type):
+    cells = date_slice(index['cube'], start_date, end_date)
+    weights = cells['count'].to_numpy()
+    for column, value in (('state', state), ('type', vehicle_type)):
+        if value is not None:
+            weights = np.where((cells[column] == value).to_numpy(dtype=bool, na_value=False), weights, 0)
+    maker_ids = pd.Categorical(cells['maker'], categories=index['makers']).codes
+    known = maker_ids >= 0
+    return np.bincount(maker_ids[known], weights=weights[known], minlength=len(index['makers'])).astype(np.int64)
+
+
+# Sorted labels of a column and each cell's label position, missing values last
+def _labels(values):
+    labels = pd.Index(values.dropna().unique()).sort_values()
+    ids = pd.Categorical(values, categories=labels).codes.astype(np.int64)
+    ids[ids < 0] = len(labels)
+    return labels.rename(values.name), ids
+
+
+# Segments of one state or type label, or all of them including missing values
+def _selection(labels, segment_ids, value):
+    if value is None:
+        return np.ones(len(segment_ids), dtype=bool)
+    position = labels.get_indexer([value])[0]
+    return segment_ids == position if position >= 0 else np.zeros(len(segment_ids), dtype=bool)
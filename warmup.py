@@ -0,0 +1,173 @@
+import json
+import os
+import threading
+import time
+from collections import Counter
+from instrument import finish_run, stage, start_run
+
+# Run warm-ups at all; benchmark.py turns them off to time cold views
+ENABLED = os.environ.get('DASHBOARD_WARMUP', '1') not in ('', '0')
+
+# Request counts per app and view, kept between restarts so the most requested views warm first
+REQUESTS_FILE = os.environ.get('WARMUP_REQUESTS_FILE', '.warmup_requests.json')
+
+# Most requested views of each app warmed besides its defaults
+POPULAR_VIEWS = int(os.environ.get('WARMUP_POPULAR_VIEWS', '5'))
+
+# Seconds between rewrites of the request counts
+SAVE_INTERVAL = 30.0
+
+# Warm-up state per app: the data fingerprint it ran for, progress and the views it warmed
+_warmups = {}
+
+# Request counts per app and view: loaded from REQUESTS_FILE, and not yet saved
+_requests = {}
+_unsaved = {}
+_lock = threading.Lock()
+_last_saved = [time.monotonic()]
+
+
+# Run an app's warm-up tasks in a background thread, once per data fingerprint,
+# so sessions already being served never wait for it. tasks is a list of
+# (name, view, function); view is the request key the task makes fast, or None.
+def start_warmup(app, fingerprint, tasks):
+    if not ENABLED:
+        return None
+    with _lock:
+        warmup = _warmups.get(app)
+        if warmup is not None and warmup['fingerprint'] == fingerprint:
+            return warmup
+        warmup = {'fingerprint': fingerprint, 'total': len(tasks), 'done': 0, 'current': None, 'errors': [],
+                  'started': time.perf_counter(), 'seconds': None, 'tasks': [], 'views': set(), 'hits': 0, 'misses': 0}
+        _warmups[app] = warmup
+
+    thread = threading.Thread(target=_run_tasks, args=(app, warmup, tasks), name=f'warmup-{app}', daemon=True)
+    thread.start()
+    return warmup
+
+
+# Count a request for one view of an app, and whether the warm-up had already prepared it
+def record_request(app, view):
+    view = _view_key(view)
+    with _lock:
+        warmup = _warmups.get(app)
+        if warmup is not None:
+            warmup['hits' if view in warmup['views'] else 'misses'] += 1
+        _unsaved.setdefault(app, Counter())[view] += 1
+        due = time.monotonic() - _last_saved[0] >= SAVE_INTERVAL
+    if due:
+        save_requests()
+
+
+# The n views of an app requested most often, as tuples of strings
+def popular_views(app, n=POPULAR_VIEWS):
+    with _lock:
+        if not _requests:
+            _requests.update(_load_requests())
+        counts = Counter(_requests.get(app, {})) + _unsaved.get(app, Counter())
+    return [view for view, _ in counts.most_common(n)]
+
+
+# Progress and hit rate of an app's latest warm-up
+def warmup_status(app):
+    with _lock:
+        warmup = _warmups.get(app)
+        if warmup is None:
+            return None
+        status = {key: value for key, value in warmup.items() if key not in ('views', 'started')}
+    status['errors'] = list(status['errors'])
+    status['tasks'] = [dict(task) for task in status['tasks']]
+    requests = status['hits'] + status['misses']
+    status['hit_rate'] = status['hits'] / requests if requests else 0.0
+    return status
+
+
+# One-line summary of warmup_status() for a sidebar caption
+def format_warmup(status):
+    if status is None:
+        return "Warm-up: not started"
+    if status['seconds'] is None:
+        text = f"Warm-up: {status['done']}/{status['total']} views ready, warming {status['current']}"
+    else:
+        text = f"Warm-up: {status['done']}/{status['total']} views ready in {status['seconds']:.1f}s"
+    if status['errors']:
+        text += f", {len(status['errors'])} failed"
+    requests = status['hits'] + status['misses']
+    return text + f", {status['hit_rate']:.0%} of {requests:,} requests warm"
+
+
+# Serve warmup_status() of every app as JSON at /warmup from a Dash app's Flask server
+def serve_warmup(server, route='/warmup'):
+    from flask import jsonify
+    server.add_url_rule(route, 'warmup', lambda: jsonify({app: warmup_status(app) for app in list(_warmups)}))
+
+
+# Merge this process's request counts into REQUESTS_FILE. Workers write it in
+# turn without a lock; a count lost to a race only shifts the popularity order.
+def save_requests(path=REQUESTS_FILE):
+    with _lock:
+        unsaved = {app: dict(counts) for app, counts in _unsaved.items()}
+        _unsaved.clear()
+        _last_saved[0] = time.monotonic()
+    if not unsaved or not path:
+        return
+
+    requests = _load_requests(path)
+    for app, counts in unsaved.items():
+        requests[app] = Counter(requests.get(app, {})) + Counter(counts)
+    with _lock:
+        _requests.clear()
+        _requests.update(requests)
+
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary_path, 'w') as f:
+            json.dump({app: [[list(view), count] for view, count in counts.items()] for app, counts in requests.items()}, f)
+        os.replace(temporary_path, path)
+    except OSError:
+        # A read-only deployment still warms the defaults
+        pass
+
+
+# Run the tasks in order, timing them as 'warmup' stages of an '<app>:warmup'
+# run. Task names are per view, so they only go to the status, never to metric labels.
+def _run_tasks(app, warmup, tasks):
+    start_run(f'{app}:warmup')
+    for name, view, function in tasks:
+        with _lock:
+            # A newer data version started its own warm-up
+            if _warmups.get(app) is not warmup:
+                break
+            warmup['current'] = name
+        started = time.perf_counter()
+        try:
+            with stage('warmup'):
+                function()
+            if view is not None:
+                with _lock:
+                    warmup['views'].add(_view_key(view))
+        except Exception as error:
+            with _lock:
+                warmup['errors'].append(f'{name}: {error!r}')
+        with _lock:
+            warmup['done'] += 1
+            warmup['tasks'].append({'name': name, 'seconds': time.perf_counter() - started})
+    with _lock:
+        warmup['current'] = None
+        warmup['seconds'] = time.perf_counter() - warmup['started']
+    finish_run()
+
+
+# Request counts saved by earlier processes
+def _load_requests(path=REQUESTS_FILE):
+    try:
+        with open(path) as f:
+            saved = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    return {app: Counter({tuple(view): count for view, count in counts}) for app, counts in saved.items()}
+
+
+# Hashable, JSON-friendly form of a view: its filter values as strings
+def _view_key(view):
+    return tuple(str(value) for value in view)